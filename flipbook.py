@@ -1,20 +1,20 @@
 from pathlib import Path
-from importlib import reload
 from re import search
 from .utils import utils
 
 import hou
-import json
+import sqlite3
+import threading
 import webbrowser as wb
 
-reload(utils)
+def start(data,kwargs,tracer=None):
+    # Timing spans of the run, DinoWriter.main passes its own tracer and writes it
+    tracer = tracer or utils.Tracer(enabled=False)
 
-def start(data,kwargs):
-
-    settingsfile = load_json(Path(__file__).parent / "settings.json")
-    paths = settingsfile["paths"]
-    advanced = settingsfile["advanced"]
-    ffmpeg_cmd = settingsfile["ffmpeg_cmd"]
+    settings = utils.Settings()
+    paths = settings.paths
+    advanced = settings.advanced
+    ffmpeg_cmd = settings.ffmpeg_cmd
 
     # Parsing settings
     fb_name =      paths.get("fb_name")
@@ -42,19 +42,65 @@ def start(data,kwargs):
 
     # Default path to write flipbook
     write_folder = Path(fb_folder.format(name=file_name)).resolve()
-    
-    if not write_folder.exists():
-        write_folder.mkdir(parents=True, exist_ok=True)
 
-    # Get newer folder version of flipbook
-    write_folder_vers = [x.name for x in write_folder.iterdir() if x.is_dir()]
-    write_folder_vers = write_folder_vers if len(write_folder_vers) > 0 else ['v000']
+    # Resume renders only missing frames of the last version, new flipbook reserves the next one
+    resume = data.get("resume")
+    render_ranges = [(frame_start, frame_end)]
+    if resume:
+        ver_str = utils.VersionIndex().last(write_folder)
+        if not ver_str:
+            utils.hmsg(f"No version of '{file_name}' to resume in\n{write_folder.as_posix()}")
+            return 0
+        # Only versions finished by a flipbook run have manifest, a version reserved by another session
+        # which is still rendering has none. Its sequence and range must match the current settings.
+        stored = utils.FrameManifest.read(write_folder / ver_str)
+        if not stored:
+            utils.hmsg(f"'{file_name}' {ver_str} has no {utils.FrameManifest.FILE}, it is still being written or was not made by a flipbook, nothing to resume")
+            return 0
+        sequence = write_folder / ver_str / fb_name.format(name=file_name, version=ver_str, fileformat=file_format)
+        if (stored.get("sequence"), stored.get("frame_start"), stored.get("frame_end")) != (sequence.name, int(frame_start), int(frame_end)):
+            utils.hmsg(f"'{file_name}' {ver_str} was written as {stored.get('sequence')}, frames {stored.get('frame_start')}-{stored.get('frame_end')}\n"
+                       f"Set the same file format and frame range to resume it")
+            return 0
+        resume_manifest = utils.FrameManifest(sequence.as_posix(), frame_padding, frame_start, frame_end).scan()
+        # Converted version has its frames deleted or complete, rendering it again would overwrite the video
+        video = Path(sequence.as_posix().replace(f"{frame_padding}.{file_format}", fb_video_ext))
+        if resume_manifest.converted or (not resume_manifest.frames and video.exists()):
+            utils.hmsg(f"'{file_name}' {ver_str} is already converted to video, nothing to resume")
+            return 0
+        resume_manifest.releaseHeld()
+        render_ranges = resume_manifest.missingRanges()
+        if not render_ranges:
+            utils.hmsg(f"Nothing to resume, every frame of '{file_name}' {ver_str} is on disk")
+            return 0
+        utils.logger(f"Resuming {file_name} {ver_str}, frames: {', '.join(f'{a}-{b}' for a, b in render_ranges)}")
+
+    # Check there is enough RAM for MPlay and free space for frames before anything is created
+    with tracer.span("preflight"):
+        estimator = utils.FlipbookEstimator()
+        estimator.calibration = estimator.calibrate(utils.FileParser().catalogPath(), write_folder.parent.as_posix())
+        aspect_x = utils.HouViewport(kwargs).cameraPixelAspect() if advanced["aspect_affects_resolution"] else 1
+        decision, message = utils.Preflight(advanced, estimator).check(write_folder, file_resolution,
+                                                                       sum(int(b - a + 1) for a, b in render_ranges),
+                                                                       file_format, aspect=aspect_x)
+    if decision == utils.Preflight.BLOCK:
+        utils.hmsg(message, level="error")
+        return 0
+    if decision == utils.Preflight.WARN:
+        if hou.ui.displayMessage(message, buttons=("Continue","Cancel"), severity=hou.severityType.Warning,
+                                 title="DinoWrite say", default_choice=0, close_choice=1):
+            return 0
+    if decision == utils.Preflight.NO_MPLAY:
+        utils.hmsg(message, buttons=("OK",), level="warning")
+    load_mplay = decision != utils.Preflight.NO_MPLAY
 
-    # Get last version
-    last_ver_str = sorted(write_folder_vers, reverse=True)[0][1:]
-    ver_digit = int(last_ver_str)+1
-    ver_padding = len(last_ver_str)
-    ver_str = f"v{str(ver_digit).zfill(ver_padding)}"
+    # Reserve newer folder version of flipbook, safe with other sessions writing the same name
+    if not resume:
+        with tracer.span("reserve version"):
+            ver_str = utils.VersionIndex().reserve(write_folder, retries=advanced["version_reserve_retries"])
+        if not ver_str:
+            utils.hmsg(f"Could not reserve new version in\n{write_folder.as_posix()}", level="error")
+            return 0
 
     # Set output filename
     filename = fb_name.format(
@@ -62,6 +108,7 @@ def start(data,kwargs):
     output_filepath = write_folder / ver_str / filename
 
     # Get Viewport
+    viewport_span = tracer.span("viewport setup")
     viewport = utils.HouViewport(kwargs)
 
     # Stash flipbook settings
@@ -87,7 +134,7 @@ def start(data,kwargs):
 
     # #Flipbook Settings
     flipbook_options.output(output_filepath.as_posix())
-    flipbook_options.outputToMPlay(True)
+    flipbook_options.outputToMPlay(load_mplay)
     flipbook_options.useResolution(True)
     flipbook_options.resolution(file_resolution)
     # flipbook_options.cropOutMaskOverlay(True)
@@ -98,14 +145,73 @@ def start(data,kwargs):
     # flipbook_options.renderAllViewports(False)
     flipbook_options.antialias(hou.flipbookAntialias.HighQuality)
 
-    # Start Flipbook
-    viewport.startFlipbook(flipbook_options)
+    # Sequence pattern for ffmpeg
+    input_files = output_filepath.as_posix().replace(frame_padding, f"%{frame_padding_int}d")
+
+    # Video conversion settings
+    if data.get("convertvideo"):
+        fps = int(hou.fps())
+        aspect = int(data.get("aspect"))
+        resolution = f"{file_resolution[0]}x{file_resolution[1]}"
+        start_frame = int(frame_start)
+
+        ffmpeg = utils.FFmpeg(config_path=None,
+                            bin=Path(__file__).parent / "bin",
+                            cmd=ffmpeg_cmd)
+
+        output_video = (output_filepath.parent /
+                        filename).as_posix().replace(f"{frame_padding}.{file_format}", fb_video_ext)
+
+    viewport_span.end()
+
+    # Streaming encode - ffmpeg eats frames while flipbook is writing them
+    stream = None
+    if data.get("convertvideo") and advanced.get("streaming_encode") and not resume:
+        if ffmpeg.streamable(file_format):
+            stream = utils.FFmpegStream(ffmpeg.pipe_cmd(fps=fps,
+                                                        resolution=resolution,
+                                                        aspect=file_resolution[0]/file_resolution[1]*aspect,
+                                                        fileformat=file_format,
+                                                        output=output_video),
+                                        output=output_video,
+                                        outputs=ffmpeg.outputs(output_video))
+        else:
+            utils.logger(f"Streaming encode is not available for {file_format}, video is converted after flipbook")
+
+    # Render monitor times every frame as it appears, to find heavy frames of the shot
+    monitor = utils.RenderMonitor(output_filepath.parent) if advanced["render_monitor"] else None
+
+    watcher = None
+    if stream or monitor:
+        watcher = utils.FrameWatcher(output_filepath.as_posix(), frame_padding, frame_start, frame_end)
+        watcher.listeners.extend(x for x in (stream, monitor) if x)
+        watcher.start()
+
+    # Start Flipbook, resumed ranges are appended to the same MPlay session
+    render_span = tracer.span("render", frames=sum(int(b - a + 1) for a, b in render_ranges))
+    for i, (range_start, range_end) in enumerate(render_ranges):
+        flipbook_options.frameRange(tuple((range_start, range_end)))
+        flipbook_options.appendFramesToCurrent(bool(resume and i))
+        viewport.startFlipbook(flipbook_options)
+        # Flipbook was cancelled, don't start the next range
+        if not Path(utils.frame_path(output_filepath.as_posix(), frame_padding, range_end)).exists():
+            break
+
+    if watcher:
+        watcher.stop()
+    render_span.end()
+
+    if monitor and monitor.frames:
+        monitor.write()
+        utils.logger(monitor.summary())
 
     # Return pane size
+    restore_span = tracer.span("viewport restore")
     viewport.maximize_viewport(False)
 
-    # #Open dir
-    if data.get("openfolder"):
+    # #Open dir, background encode opens it when video is done
+    background_encode = data.get("convertvideo") and not stream and advanced.get("background_encode")
+    if data.get("openfolder") and not background_encode:
         wb.open(write_folder.as_uri())
 
     # Return color scheme
@@ -115,42 +221,219 @@ def start(data,kwargs):
     # Return background image
     if data.get("bgimage"):
         viewport.displayBackgroundImage()
+    restore_span.end()
+
+    # Written frames of this version, exact missing ranges instead of counting files
+    manifest_span = tracer.span("incomplete check")
+    manifest = utils.FrameManifest(output_filepath.as_posix(), frame_padding, frame_start, frame_end).scan()
+
+    # Release reserved version if nothing was written, resumed version is kept as it was
+    if not manifest.frames:
+        if stream:
+            stream.cancel()
+        # Cancelled flipbook can leave empty frames, which manifest doesn't count as written
+        if not resume:
+            try:
+                [x.unlink() for x in output_filepath.parent.iterdir() if x.is_file()]
+                output_filepath.parent.rmdir()
+            except OSError as e:
+                utils.logger(f"Could not release reserved version {ver_str}\n{e}")
+        return 0
+
+    # Flipbook catalog for "existing flipbooks" menu
+    catalog = utils.FileParser().catalog()
+    def update_catalog(frames=False):
+        folder = output_filepath.parent
+        if not folder.exists():
+            return
+        files = [x for x in folder.iterdir() if x.is_file()]
+        frame_bytes = manifest.bytes() if frames else None
+        try:
+            catalog.record(write_folder.parent.as_posix(), file_name, ver_str,
+                           frame_start, frame_end, file_resolution, file_format,
+                           sum(x.stat().st_size for x in files), frame_bytes,
+                           manifest.rendered() if frames else None, aspect_x)
+        except sqlite3.Error as e:
+            utils.logger(f"Could not update flipbook catalog\n{e}")
+
+    # Summary of the run for performance history report, see utils/history.py
+    def save_history(encode_seconds=None):
+        if not advanced["history"]:
+            return
+        stages = tracer.durations()
+        videos = [Path(x) for x in ffmpeg.outputs(output_video)] if data.get("convertvideo") else []
+        deliverables = [x.get("name", "") for x in ffmpeg.deliverables()] if data.get("convertvideo") else []
+        presets = ffmpeg.presets() if data.get("convertvideo") else []
+        try:
+            utils.FileParser().history().append({
+                "name": file_name,
+                "version": ver_str,
+                "hip": hou.hipFile.basename(),
+                "resolution": list(file_resolution),
+                "fileformat": file_format,
+                "frames": len(manifest.frames) - len(manifest.held),
+                "resumed": bool(resume),
+                "preset": "+".join(presets) if videos else None,
+                "deliverables": "+".join(deliverables) or "default" if videos else None,
+                "streamed": bool(stream),
+                "stages": stages,
+                "render_seconds": stages.get("render"),
+                "encode_seconds": encode_seconds,
+                "frame_bytes": manifest.bytes(),
+                "video_bytes": sum(x.stat().st_size for x in videos if x.exists()) or None,
+            })
+        except OSError as e:
+            utils.logger(f"Could not write performance history\n{e}")
+
+    # Thumbnail and contact sheet for "existing flipbooks" menu, made in a thread from a snapshot of written frames,
+    # every input deletion waits for it with delete_input()
+    thumbnail_cache = utils.FileParser().thumbnails()
+    def make_thumbnails(frame_files):
+        middle = utils.frame_path(output_filepath.as_posix(), frame_padding, (frame_start+frame_end)//2)
+        if not Path(middle).exists():
+            return
+        thumbnail = thumbnail_cache.thumbnail(middle, advanced["thumbnail_size"])
+        contact_sheet = None
+        if thumbnail and advanced["contact_sheet"]:
+            contact_sheet = thumbnail_cache.contact_sheet(thumbnail, frame_files,
+                                                          advanced["thumbnail_size"], advanced["contact_sheet_tiles"])
+        try:
+            catalog.setImages(write_folder.parent.as_posix(), file_name, ver_str, thumbnail, contact_sheet)
+        except sqlite3.Error as e:
+            utils.logger(f"Could not update flipbook catalog\n{e}")
+        thumbnail_cache.evict()
+
+    thumbnails = None
+    def delete_input(files):
+        if thumbnails:
+            thumbnails.join()
+        [x.unlink(missing_ok=True) for x in files]
+
+    # Only a fully rendered sequence is marked converted and deleted, incomplete or held frames stay to be resumed
+    def mark_converted():
+        if not manifest.complete() or manifest.held:
+            return
+        manifest.converted = True
+        manifest.write()
+        if advanced['conversion_delete_input_sequence']:
+            with tracer.span("delete input"):
+                delete_input(encoded_files)
 
     files_keeped=True
-    if advanced['delete_incomplete_fb']:
-        fb_length = frame_end - frame_start + 1
-        files = [x for x in output_filepath.parent.iterdir()]
-        
-        if len(files)<fb_length-10: #extra padding in 10 frames
-            [x.unlink() for x in files]
+    if not manifest.complete():
+        utils.logger(f"Missing frames in {output_filepath.parent.as_posix()}: {manifest.describeMissing()}")
+        # Holding previous frames gives complete video in one pass, no re-render and no extra disk space
+        if advanced['fill_missing_frames'] and data.get("convertvideo") and not stream:
+            held = manifest.fillGaps()
+            utils.logger("Held frames: " + ", ".join(f"{frame}<-{source}" for frame, source in held.items()))
+        elif advanced['delete_incomplete_fb'] and not resume:
+            if stream:
+                stream.cancel()
+                stream = None
+            [x.unlink() for x in output_filepath.parent.iterdir()]
             output_filepath.parent.rmdir()
             files_keeped=False
+    manifest_span.end()
 
-    if data.get("convertvideo") and files_keeped:
-        fps = int(hou.fps())
-        aspect = int(data.get("aspect"))
-        resolution = f"{file_resolution[0]}x{file_resolution[1]}"
-        start_frame = int(frame_start)
+    # Black, blank, duplicate or broken frames are reported before encoding starts
+    skip_encode = False
+    with tracer.span("verify"):
+        problems = files_keeped and advanced['verify_frames'] and manifest.verify(advanced['verify_workers'])
+    if problems:
+        message = f"Suspicious frames in {file_name} {ver_str}\n\n{manifest.describeProblems()}"
+        utils.logger(message)
+        if data.get("convertvideo"):
+            skip_encode = bool(hou.ui.displayMessage(message, buttons=("Encode","Skip encoding"),
+                                                     severity=hou.severityType.Warning, title="DinoWrite say",
+                                                     default_choice=0, close_choice=0))
+        else:
+            utils.hmsg(message, buttons=("OK",), level="warning")
 
-        ffmpeg = utils.FFmpeg(config_path=None,
-                            bin=Path(__file__).parent / "bin",
-                            cmd=ffmpeg_cmd)
+    if skip_encode:
+        if stream:
+            stream.cancel()
+            stream = None
+        if data.get("openfolder") and background_encode:
+            wb.open(write_folder.as_uri())
 
-        input_files = output_filepath.as_posix().replace(frame_padding, f"%{frame_padding_int}d")
-        output_video = (output_filepath.parent /
-                        filename).as_posix().replace(f"{frame_padding}.{file_format}", fb_video_ext)
+    if files_keeped:
+        with tracer.span("catalog and thumbnails"):
+            manifest.write()
+            update_catalog(frames=True)
+            thumbnails = threading.Thread(target=make_thumbnails,
+                                          args=([manifest.frames[x][0].as_posix() for x in sorted(manifest.frames)],),
+                                          daemon=True)
+            thumbnails.start()
+
+    # ffmpeg reads a sequence until the first gap, so only the first written run is converted
+    # and only its frames are deleted, frames after the gap stay on disk
+    encode = data.get("convertvideo") and files_keeped and not skip_encode
+    if encode:
+        start_frame, convert_end = manifest.writtenRanges()[0]
+        if convert_end != frame_end or start_frame != frame_start:
+            utils.logger(f"Converting frames {start_frame}-{convert_end} only, missing: {manifest.describeMissing()}")
+        encoded_files = manifest.files(start_frame, convert_end)
 
-        ffmpeg.convert_to_video(fps=fps,
+    # Failed stream falls back to conversion of the sequence on disk
+    streamed = False
+    if stream:
+        with tracer.span("encode", mode="stream"):
+            streamed = stream.finish()
+        if not streamed:
+            utils.logger(f"Streaming encode failed, converting sequence\n{input_files}")
+
+    # Full background queue falls back to foreground conversion
+    job = None
+    if streamed:
+        mark_converted()
+        update_catalog()
+        save_history()
+
+    elif background_encode and encode:
+        def on_done(job):
+            if job.status == "done":
+                mark_converted()
+            update_catalog()
+            save_history(job.finished - job.started if job.status == "done" else None)
+            if data.get("openfolder"):
+                wb.open(write_folder.as_uri())
+
+        with tracer.span("encode", mode="background submit"):
+            job = ffmpeg.submit(fps=fps,
                                 resolution=resolution,
                                 aspect=file_resolution[0]/file_resolution[1]*aspect,
                                 start_frame=start_frame,
                                 input=input_files,
                                 output=output_video,
-                                delete_input=advanced['conversion_delete_input_sequence'])
-
-def load_json(file):
-    try:
-        with open(file, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
\ No newline at end of file
+                                on_done=on_done,
+                                queue_size=advanced["encode_queue_size"],
+                                end_frame=convert_end,
+                                workers=advanced["encode_workers"],
+                                min_segment=advanced["encode_min_segment"])
+        if job:
+            utils.logger(f"Encoding in background:\n{output_video}")
+        else:
+            utils.logger(f"Encoding in foreground:\n{output_video}")
+            if data.get("openfolder"):
+                wb.open(write_folder.as_uri())
+
+    if encode and not streamed and not job:
+        with tracer.span("encode", mode="foreground"), utils.HouProgress(f"Encoding {Path(output_video).name}") as progress:
+            encoded = ffmpeg.convert_to_video(fps=fps,
+                                              resolution=resolution,
+                                              aspect=file_resolution[0]/file_resolution[1]*aspect,
+                                              start_frame=start_frame,
+                                              input=input_files,
+                                              output=output_video,
+                                              delete_input=False,
+                                              end_frame=convert_end,
+                                              workers=advanced["encode_workers"],
+                                              min_segment=advanced["encode_min_segment"],
+                                              progress=progress)
+        if encoded:
+            mark_converted()
+        update_catalog()
+        save_history(tracer.durations().get("encode") if encoded else None)
+
+    elif files_keeped and not encode:
+        save_history()
@@ -0,0 +1,58 @@
+"""Flipbook catalog: folder sync, name search and disk calibration"""
+import unittest
+from pathlib import Path
+
+from test_startup import StubbedTestCase
+
+class FlipbookCatalogTest(StubbedTestCase):
+    modules = ("utils.catalog",)
+
+    def setUp(self):
+        temp = Path(self.temp())
+        self.root = temp / "preview"
+        self.root.mkdir()
+        self.db = self.catalog.FlipbookCatalog((temp / "catalog.db").as_posix())
+
+    def test_sync_picks_up_and_drops_folders(self):
+        for name in ("shot_010", "shot_020"):
+            (self.root / name).mkdir()
+        self.db.sync(self.root.as_posix())
+        self.assertEqual(sorted(self.db.names(self.root.as_posix())), ["shot_010", "shot_020"])
+
+        (self.root / "shot_010").rmdir()
+        (self.root / "shot_030").mkdir()
+        self.db.sync(self.root.as_posix())
+        self.assertEqual(sorted(self.db.names(self.root.as_posix())), ["shot_020", "shot_030"])
+
+    def test_search_escapes_wildcards(self):
+        root = self.root.as_posix()
+        for name in ("fx_smoke", "fxsmoke", "anim_100%"):
+            self.db.record(root, name, "v001", 1, 10, (100, 100), "png", 1000)
+
+        self.assertEqual(self.db.names(root, "fx_"), ["fx_smoke"])
+        self.assertEqual(self.db.names(root, "100%"), ["anim_100%"])
+        self.assertEqual(sorted(self.db.names(root, "SMOKE")), ["fx_smoke", "fxsmoke"])
+        self.assertEqual(len(self.db.names(root)), 3)
+
+    def test_versions_keep_sizes(self):
+        root = self.root.as_posix()
+        self.db.record(root, "shot", "v001", 1, 10, (100, 100), "exr", 5000, 4000, 10)
+        # Later record without frame sizes, like after input sequence is deleted
+        self.db.record(root, "shot", "v001", 1, 10, (100, 100), "exr", 1000)
+
+        version = self.db.versions(root, "shot")[0]
+        self.assertEqual((version["bytes"], version["frame_bytes"], version["frames"]), (1000, 4000, 10))
+
+    def test_bytes_per_pixel_counts_rendered_frames(self):
+        root = self.root.as_posix()
+        # 50 of 100 frames rendered, 2 bytes per pixel
+        self.db.record(root, "half", "v001", 1, 100, (100, 10), "exr", 0, 50 * 1000 * 2, 50)
+        # Width doubled by pixel aspect in estimator, 1 byte per estimated pixel
+        self.db.record(root, "wide", "v001", 1, 10, (100, 10), "png", 0, 10 * 2000, 10, 2.0)
+        # Recorded before frame count was stored
+        self.db.record(root, "old", "v001", 1, 10, (100, 10), "jpg", 0, 500)
+
+        self.assertEqual(self.db.bytesPerPixel(root), {"exr": 2.0, "png": 1.0})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Parallel encode: segment split and concat stages"""
+import json
+import unittest
+from pathlib import Path
+
+from test_startup import ROOT, StubbedTestCase
+
+class FFmpegSegmentsTest(StubbedTestCase):
+
+    def setUp(self):
+        with open(ROOT / "settings.json") as f:
+            self.cmd = json.load(f)["ffmpeg_cmd"]
+        self.ffmpeg = self.utils.FFmpeg(config_path=None, bin=ROOT / "bin", cmd=self.cmd)
+
+    def test_segments_cover_range(self):
+        for start, end, workers, min_segment in ((1, 301, 8, 100), (1001, 1100, 4, 10), (1, 1, 4, 100), (1, 250, 0, 1)):
+            segments = self.ffmpeg.segments(start, end, workers, min_segment)
+            self.assertEqual(segments[0][0], start)
+            self.assertEqual(sum(x[1] for x in segments), end - start + 1)
+            for (frame, frames), (next_frame, _) in zip(segments, segments[1:]):
+                self.assertEqual(frame + frames, next_frame)
+
+    def test_segments_keep_minimum(self):
+        self.assertEqual(self.ffmpeg.segments(1, 301, 8, 100), [(1, 101), (102, 100), (202, 100)])
+        self.assertEqual(self.ffmpeg.segments(1, 150, 8, 100), [(1, 150)])
+        self.assertEqual(len(self.ffmpeg.segments(1, 1000, 4, 10)), 4)
+
+    def test_parallel_stages(self):
+        stages, temp_files, files = self.ffmpeg.parallel_stages(start_frame=1, end_frame=200, input="/f/shot.%04d.png",
+                                                                output="/f/shot.mov", workers=2, min_segment=100)
+        encode, concat = stages
+        self.assertEqual(len(encode), 2)
+        self.assertEqual([x[x.index("-start_number") + 1] for x in encode], ["1", "101"])
+        self.assertEqual([x[x.index("-frames:v") + 1] for x in encode], ["100", "100"])
+        self.assertEqual([x[-1] for x in encode], ["/f/shot.part000.mov", "/f/shot.part001.mov"])
+
+        # Concat lists are only returned, EncodeJob writes them when it starts
+        self.assertEqual(files, {"/f/shot.concat.txt": "file 'shot.part000.mov'\nfile 'shot.part001.mov'\n"})
+        self.assertFalse(Path("/f/shot.concat.txt").exists())
+        self.assertEqual(concat, [["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", "/f/shot.concat.txt",
+                                   "-c", "copy", "/f/shot.mov"]])
+        self.assertEqual(sorted(temp_files), ["/f/shot.concat.txt", "/f/shot.part000.mov", "/f/shot.part001.mov"])
+
+    def test_presets(self):
+        self.assertEqual(self.ffmpeg.presets(), ["slow"])
+        self.cmd["outputs"][2]["enabled"] = True
+        self.cmd["outputs"][2]["args"].remove("-preset fast")
+        self.assertEqual(self.ffmpeg.presets(), ["slow", "default"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Performance history report and regression check"""
+import io
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from test_startup import StubbedTestCase
+
+class PerformanceHistoryTest(StubbedTestCase):
+    modules = ("utils.history",)
+
+    def setUp(self):
+        self.path = Path(self.temp()) / "history.jsonl"
+        self.store = self.history.PerformanceHistory(self.path.as_posix())
+
+    def add(self, name, render_seconds, time, **record):
+        self.store.append({"name": name, "frames": 100, "render_seconds": render_seconds, "time": time, **record})
+
+    def test_report_medians(self):
+        for i, seconds in enumerate((10, 20, 40)):
+            self.add("shot", seconds, i, preset="slow", frame_bytes=1000)
+        self.add("other", 5, 3, preset="fast")
+        with open(self.path, "a") as f:
+            f.write('{"broken": \n')
+
+        report = self.store.report("preset")
+        self.assertEqual(report["slow"]["runs"], 3)
+        self.assertEqual(report["slow"]["render_fps"], 5.0)
+        self.assertEqual(report["slow"]["bytes_per_frame"], 10.0)
+        self.assertIsNone(report["slow"]["encode_fps"])
+        self.assertEqual(report["fast"]["render_fps"], 20.0)
+
+    def test_regressions(self):
+        for i in range(3):
+            self.add("shot", 10, i)
+        self.add("shot", 12, 3)
+        self.add("shot", 30, 4)
+        self.add("new", 30, 5)
+
+        found = self.store.regressions("name", threshold=1.5, min_history=3)
+        self.assertEqual([(x[0]["time"], x[1]) for x in found], [(4, "render_fps")])
+        self.assertAlmostEqual(found[0][2], 100 / 30)
+        self.assertEqual(found[0][3], 10.0)
+
+    def test_cli_exit_codes(self):
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(self.history.main([self.path.as_posix()]), 1)
+            for i in range(3):
+                self.add("shot", 10, i)
+            self.assertEqual(self.history.main([self.path.as_posix()]), 0)
+            self.add("shot", 60, 3)
+            self.assertEqual(self.history.main([self.path.as_posix()]), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Written frames of a version: missing ranges, held frames and stored manifest"""
+import unittest
+from pathlib import Path
+
+from test_startup import StubbedTestCase
+
+class FrameManifestTest(StubbedTestCase):
+
+    def setUp(self):
+        self.folder = Path(self.temp())
+        self.sequence = (self.folder / "shot.v001.$F4.png").as_posix()
+
+    def write(self, *frames, data=b"frame"):
+        for frame in frames:
+            (self.folder / f"shot.v001.{frame:04d}.png").write_bytes(data)
+
+    def manifest(self, start=1, end=10):
+        return self.utils.FrameManifest(self.sequence, "$F4", start, end).scan()
+
+    def test_missing_ranges(self):
+        self.write(1, 2, 3, 6, 10)
+        self.write(7, data=b"")
+        (self.folder / "notes.txt").write_text("stray")
+        self.write(11)
+
+        manifest = self.manifest()
+        self.assertEqual(sorted(manifest.frames), [1, 2, 3, 6, 10])
+        self.assertEqual(manifest.missingRanges(), [(4, 5), (7, 9)])
+        self.assertEqual(manifest.writtenRanges(), [(1, 3), (6, 6), (10, 10)])
+        self.assertEqual(manifest.describeMissing(), "4-5, 7-9")
+        self.assertEqual(sorted(x.name for x in manifest.strays), ["notes.txt", "shot.v001.0011.png"])
+        self.assertFalse(manifest.complete())
+
+    def test_files_in_range(self):
+        self.write(1, 2, 3, 6)
+        names = sorted(x.name for x in self.manifest().files(1, 3))
+        self.assertEqual(names, ["shot.v001.0001.png", "shot.v001.0002.png", "shot.v001.0003.png"])
+
+    def test_fill_gaps_and_release(self):
+        self.write(2, 3, 6)
+        manifest = self.manifest(1, 7)
+
+        held = manifest.fillGaps()
+        self.assertEqual(held, {1: 2, 4: 3, 5: 3, 7: 6})
+        self.assertTrue(manifest.complete())
+        self.assertEqual(manifest.rendered(), 3)
+        self.assertEqual(manifest.bytes(), 3 * len(b"frame"))
+        manifest.write()
+
+        # Next scan knows held frames from manifest.json and releases them for resume
+        manifest = self.manifest(1, 7)
+        self.assertEqual(manifest.held, held)
+        manifest.releaseHeld()
+        self.assertEqual(manifest.missingRanges(), [(1, 1), (4, 5), (7, 7)])
+        self.assertEqual(self.manifest(1, 7).missingRanges(), [(1, 1), (4, 5), (7, 7)])
+        self.assertEqual(self.manifest(1, 7).held, {})
+
+    def test_stored_manifest(self):
+        self.assertIsNone(self.utils.FrameManifest.read(self.folder))
+        self.write(1, 2)
+        manifest = self.manifest(1, 2)
+        manifest.converted = True
+        manifest.write()
+
+        stored = self.utils.FrameManifest.read(self.folder)
+        self.assertEqual((stored["sequence"], stored["frame_start"], stored["frame_end"]), ("shot.v001.$F4.png", 1, 2))
+        self.assertTrue(self.manifest(1, 2).converted)
+
+if __name__ == "__main__":
+    unittest.main()
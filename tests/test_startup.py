@@ -0,0 +1,139 @@
+"""Shelf click to window latency budget
+
+Imports `ui` outside of Houdini with hou, PySide2 and pxr replaced by empty stubs,
+so only the tool's own import cost is measured, and checks it against
+advanced.startup_budget_ms of settings.json.
+
+    python -m unittest discover tests
+"""
+import importlib
+import json
+import re
+import sys
+import tempfile
+import time
+import types
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+PACKAGE = ROOT.name
+
+class _StubMeta(type):
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Stub
+
+class _Stub(metaclass=_StubMeta):
+    """Stands for any Houdini or Qt object: can be called, subclassed and chained"""
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Stub()
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _Stub()
+
+    def __or__(self, other):
+        return self
+    __ror__ = __or__
+
+class _StubModule(types.ModuleType):
+    """Module giving _Stub for any name, remembers what was asked for"""
+    def __init__(self, name):
+        super().__init__(name)
+        self.accessed = []
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        self.accessed.append(name)
+        return _Stub
+
+def install_stubs():
+    # Star imports need explicit names, take every Qt name used by the tool
+    qt_names = set()
+    for path in ROOT.rglob("*.py"):
+        qt_names |= set(re.findall(r"\bQ[A-Za-z]\w*", path.read_text(encoding="utf-8", errors="ignore")))
+    qt_names |= {"Signal", "Slot"}
+
+    for name in ("hou", "hdefereval", "pxr", "PySide2", "PySide2.QtWidgets", "PySide2.QtGui", "PySide2.QtCore"):
+        module = _StubModule(name)
+        if name.startswith("PySide2."):
+            module.__all__ = sorted(qt_names)
+            for qt_name in qt_names:
+                setattr(module, qt_name, _Stub)
+        sys.modules[name] = module
+
+    hou = sys.modules["hou"]
+    hou.getenv = lambda name, default=None: default
+    hou.text = types.SimpleNamespace(expandString=lambda text: text)
+
+class StubbedTestCase(unittest.TestCase):
+    """Tool modules imported once per class with stubs, sys.modules is restored after the class"""
+    modules = ("utils.utils",)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.saved = dict(sys.modules)
+        install_stubs()
+        sys.path.insert(0, ROOT.parent.as_posix())
+        for name in cls.modules:
+            setattr(cls, name.rpartition(".")[2], importlib.import_module(f"{PACKAGE}.{name}"))
+
+    @classmethod
+    def tearDownClass(cls):
+        sys.path.remove(ROOT.parent.as_posix())
+        sys.modules.clear()
+        sys.modules.update(cls.saved)
+
+    def temp(self) -> str:
+        """Temporary folder removed after the test"""
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        return folder.name
+
+class StartupBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict(sys.modules)
+        install_stubs()
+        sys.path.insert(0, ROOT.parent.as_posix())
+        for name in list(sys.modules):
+            if name == PACKAGE or name.startswith(PACKAGE + "."):
+                del sys.modules[name]
+
+    def tearDown(self):
+        sys.path.remove(ROOT.parent.as_posix())
+        sys.modules.clear()
+        sys.modules.update(self.saved)
+
+    def test_import_within_budget(self):
+        with open(ROOT / "settings.json") as f:
+            budget = json.load(f)["advanced"]["startup_budget_ms"]
+
+        start = time.perf_counter()
+        ui = importlib.import_module(f"{PACKAGE}.ui")
+        elapsed = (time.perf_counter() - start) * 1000
+
+        self.assertTrue(hasattr(ui, "show"))
+        self.assertLess(elapsed, budget, f"ui import took {elapsed:.0f} ms, budget is {budget} ms")
+
+    def test_production_import_is_lazy(self):
+        reloads = []
+        reload = importlib.reload
+        importlib.reload = lambda module: reloads.append(module.__name__) or module
+        try:
+            importlib.import_module(f"{PACKAGE}.ui")
+        finally:
+            importlib.reload = reload
+
+        self.assertEqual(reloads, [], "modules are reloaded without DINOWRITE_DEV")
+        self.assertEqual(sys.modules["pxr"].accessed, [], "pxr is imported outside of LOP branch")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Version folders: numeric order and reserve retry"""
+import io
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from test_startup import StubbedTestCase
+
+class VersionIndexTest(StubbedTestCase):
+
+    def setUp(self):
+        self.folder = Path(self.temp())
+        self.index = self.utils.VersionIndex()
+        self.index.invalidate()
+
+    def test_numeric_order(self):
+        for name in ("v998", "v1000", "v999", "v1001_old", "notes"):
+            (self.folder / name).mkdir()
+        (self.folder / "v1002").touch()
+
+        self.assertEqual(self.index.versions(self.folder), ["v998", "v999", "v1000"])
+        self.assertEqual(self.index.last(self.folder), "v1000")
+        self.assertEqual(self.index.next(self.folder), "v1001")
+
+    def test_next_keeps_padding(self):
+        self.assertEqual(self.index.next(self.folder), "v001")
+        (self.folder / "v009").mkdir()
+        self.assertEqual(self.index.next(self.folder), "v010")
+
+    def test_reserve_creates_folder(self):
+        self.assertEqual(self.index.reserve(self.folder, backoff=0), "v001")
+        self.assertEqual(self.index.reserve(self.folder, backoff=0), "v002")
+        self.assertTrue((self.folder / "v002").is_dir())
+
+    def test_reserve_retries_taken_version(self):
+        # Another session takes the version between listing and mkdir
+        taken = []
+        next_version = self.index.next
+        def racing_next(folder):
+            version = next_version(folder)
+            if not taken:
+                (Path(folder) / version).mkdir()
+                taken.append(version)
+            return version
+        self.index.next = racing_next
+
+        self.assertEqual(self.index.reserve(self.folder, backoff=0), "v002")
+        self.assertEqual(taken, ["v001"])
+
+    def test_reserve_gives_up(self):
+        self.index.next = lambda folder: "v001"
+        (self.folder / "v001").mkdir()
+        with redirect_stdout(io.StringIO()):
+            self.assertIsNone(self.index.reserve(self.folder, retries=3, backoff=0))
+
+if __name__ == "__main__":
+    unittest.main()
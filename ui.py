@@ -62,7 +62,12 @@ COLORS_PALLETE = {
 
 BYTES_TOLERANCE = 1024
 
+PROBE_DEBOUNCE_MS = 250
+
 # IMPORTs
+from time import perf_counter
+IMPORT_START = perf_counter()
+
 from PySide2.QtWidgets import *
 from PySide2.QtGui import *
 from PySide2.QtCore import *
@@ -77,13 +82,39 @@ from . import flipbook
 import hou
 import json
 
-reload(flipbook)
-reload(widgets)
-reload(utils)
+def reload_modules():
+    """
+    Developer path: pick up changes in source files without restarting Houdini
+    Production import never reloads, set DINOWRITE_DEV=1 to reload on every shelf click
+    """
+    reload(utils)
+    reload(widgets)
+    reload(flipbook)
+
+if hou.getenv("DINOWRITE_DEV"):
+    reload_modules()
 
 Icons = utils.Icons()
 Fileparser = utils.FileParser()
 
+IMPORT_TIME = perf_counter() - IMPORT_START
+
+WINDOW = None
+
+def show(kwargs):
+    """
+    Shelf entry point
+    Window is built once per session, after that it is only hidden and shown again
+    """
+    global WINDOW
+    if WINDOW is None:
+        WINDOW = DinoWriter(kwargs)
+        # Kept window is only hidden on close, next shelf click shows it again
+        WINDOW.setAttribute(Qt.WA_DeleteOnClose, False)
+    else:
+        WINDOW.refresh(kwargs)
+    return WINDOW
+
 class TitleBar(QWidget):
     """
     Custom titlebar with LOGO & TITLE & CLOSE BUTTON
@@ -155,6 +186,7 @@ class DinoWriter(QWidget):
         Parent widget to houdini window to make it visible
         '''
         super().__init__()
+        startup = perf_counter()
 
         '''
         Adding search path to Qt to be able to using "icons:filepath" prefix in stylesheets files
@@ -166,7 +198,8 @@ class DinoWriter(QWidget):
         Setting some flags to widget
         WindowTitle - allows you to track the widget among others and not paint a new widget, in case of a repeat call
         QtWindow and Frameless flags - just for TitleBar
-        WA_DeleteOnClose attribute - allows to delete widget in application childrens after widget is closed
+        WA_DeleteOnClose attribute - allows to delete widget in application childrens after widget is closed,
+        show function clears it for the window it keeps between shelf clicks
         FixedSize - Blocks the user from being able to stretch the widget in different directions
         '''
         self.setWindowTitle(WINDOW_TITLE)
@@ -188,17 +221,7 @@ class DinoWriter(QWidget):
         self.setMask(mask)
 
 
-        '''
-        Settng proper widget position
-        I'm believe that in should work on any monitor setup's
-        The point is that the window does NOT spawn on the border of the monitors or beyond
-        '''
-        mouse_pos = QCursor.pos()
-        screen = QDesktopWidget().screenNumber(mouse_pos)
-        screenGeometry = QDesktopWidget().screenGeometry(screen)
-        xpoint = min( max(mouse_pos.x()-WINDOW_WIDTH/2,screenGeometry.x() + WIDTH_OFFSET) , screenGeometry.x() + screenGeometry.width() - WINDOW_WIDTH - WIDTH_OFFSET )
-        ypoint = max( min(mouse_pos.y()-WINDOW_HIGHT/2+HIGHT_OFFSET,screenGeometry.height()-WINDOW_HIGHT-100) , screenGeometry.y() + 10 )
-        self.move(QPoint(xpoint,ypoint))
+        self.placeWindow()
 
 
         '''
@@ -207,15 +230,39 @@ class DinoWriter(QWidget):
         self.hou_viewport = utils.HouViewport(kwargs)
         self.kwargs = kwargs
 
-        settingsfile = self.load_json(Path(__file__).parent / "settings.json")
-        self.paths = settingsfile["paths"]
-        self.formats = settingsfile["formats"]
-        self.addresolution = settingsfile["custom_resolution"]
-        self.addframerange = settingsfile["custom_framerange"]
+        settings = utils.Settings()
+        self.paths = settings.paths
+        self.formats = settings.formats
+        self.addresolution = settings.custom_resolution
+        self.addframerange = settings.custom_framerange
 
         self.data = self.load_json(Path(self.get_tmp(), self.paths.get("tmp_data")))
+
+        '''
+        Filesystem probes (versions, existing flipbooks) run in background threads,
+        typing is debounced, so the window never waits on slow network shares
+        '''
+        self.version = "v001"
+        self.thumbnails = {}
+        self.frames_cache = {}
+        self.estimator = utils.FlipbookEstimator()
+        self.fs = utils.FsWorker(self)
+        self.fs.done.connect(self.applyProbe)
+        self.probe_timer = QTimer(self)
+        self.probe_timer.setSingleShot(True)
+        self.probe_timer.setInterval(PROBE_DEBOUNCE_MS)
+        self.probe_timer.timeout.connect(self.requestProbes)
+
         self.initUI()
 
+        '''
+        Shelf click to window latency budget
+        Import time is counted only on the first click, when module is really imported
+        '''
+        global IMPORT_TIME
+        self.checkBudget(startup, IMPORT_TIME)
+        IMPORT_TIME = 0
+
     def initUI(self):
 
         ### INFO LINE
@@ -225,7 +272,7 @@ class DinoWriter(QWidget):
         info_layout.setContentsMargins(10,5,10,5)
 
         self.cameraname = widgets.Label("Camera: {camera}".format(camera=self.hou_viewport.cameraName()))
-        self.ramusage =   widgets.Label("RAM Usage: {ramusage}")
+        self.ramusage =   widgets.Label("RAM Usage: {ramusage}    Disk: {disk}")
         self.seqname = widgets.ColorfulLabel()
         dino_paint = widgets.HIcon(Icons.get("label_dino_paint.svg",type="Path"),size=50)
         
@@ -249,10 +296,9 @@ class DinoWriter(QWidget):
         ### FIRST LINE
         label_filename =   widgets.HBLabel("Name")
         self.filename =    widgets.LineEdit(self.read_data("name", FILENAME_DEFAULT),hint=FILENAME_HINT)
-        folders_list = self.flipbooks_menu()
-        self.filename.setCompleter(widgets.Completer(folders_list))
+        self.filename.setCompleter(widgets.Completer([]))
         self.filename.installEventFilter(self)
-        self.menu_button = widgets.DropDownButton(menu=folders_list, callback=self.setMenuItemFile)
+        self.menu_button = widgets.DropDownButton(menu=[], callback=self.setMenuItemFile)
 
         grid_layout.addWidget(label_filename, 0, 0)
         grid_layout.addWidget(self.filename, 0, 1, 1, 2)
@@ -342,6 +388,12 @@ class DinoWriter(QWidget):
         self.writebutton.setIconSize(QSize(35,35))
         self.writebutton.setLayoutDirection(Qt.RightToLeft)
 
+        self.resumebutton = widgets.PushButton("RESUME",size=widgets.MAIN_SIZE+4)
+        self.resumebutton.setToolTip("Render only missing frames of the last version of this flipbook \nand continue to video conversion as usual")
+        write_layout = widgets.HLayout([self.writebutton,self.resumebutton],align=None)
+        write_layout.setStretch(0,3)
+        write_layout.setStretch(1,1)
+
         # LAYOUTS
         TITLE_LAYOUT = QVBoxLayout() 
         TITLE_LAYOUT.setContentsMargins(0,0,0,0)
@@ -353,7 +405,7 @@ class DinoWriter(QWidget):
         MAIN_LAYOUT.addWidget(info_frame)
         MAIN_LAYOUT.addWidget(main_frame)
         MAIN_LAYOUT.addWidget(checkbox_frame)
-        MAIN_LAYOUT.addWidget(self.writebutton)
+        MAIN_LAYOUT.addLayout(write_layout)
 
         TITLE_LAYOUT.addWidget(TitleBar(self))
         TITLE_LAYOUT.addLayout(MAIN_LAYOUT)
@@ -361,8 +413,10 @@ class DinoWriter(QWidget):
         self.setLayout(TITLE_LAYOUT)
 
         # SIGNALS
-        self.filename.editingFinished.connect(self.updateColorfulLabel)
-        self.menu_button.menu.triggered.connect(self.updateColorfulLabel)
+        self.filename.textEdited.connect(lambda: self.updateColorfulLabel())
+        self.filename.textEdited.connect(lambda: self.probe_timer.start())
+        self.filename.editingFinished.connect(lambda: self.requestProbes())
+        self.menu_button.menu.triggered.connect(lambda: self.requestProbes())
         self.fileformat.currentIndexChanged.connect(self.updateColorfulLabel)
         self.resx.editingFinished.connect(self.updateRamUsage)
         self.resx.editingFinished.connect(self.updateResolutions)
@@ -373,12 +427,15 @@ class DinoWriter(QWidget):
         self.framestart.editingFinished.connect(self.updateRamUsage)
         self.frameend.editingFinished.connect(self.updateRamUsage)
         self.frame_menu.menu.triggered.connect(self.updateRamUsage)
+        self.fileformat.currentIndexChanged.connect(self.updateRamUsage)
         self.convertvideo.stateChanged.connect(self.updateFileFormat)
-        self.writebutton.clicked.connect(self.main)
+        self.writebutton.clicked.connect(lambda: self.main())
+        self.resumebutton.clicked.connect(lambda: self.main(resume=True))
 
         # SCRIPTS
         self.updateRamUsage()
         self.updateColorfulLabel()
+        self.requestProbes(flipbooks=True)
         self.updateFileFormat()
         self.updateResolutions()
 
@@ -398,6 +455,56 @@ class DinoWriter(QWidget):
         else:
             self.show()
 
+    def placeWindow(self):
+        '''
+        Settng proper widget position
+        I'm believe that in should work on any monitor setup's
+        The point is that the window does NOT spawn on the border of the monitors or beyond
+        '''
+        mouse_pos = QCursor.pos()
+        screen = QDesktopWidget().screenNumber(mouse_pos)
+        screenGeometry = QDesktopWidget().screenGeometry(screen)
+        xpoint = min( max(mouse_pos.x()-WINDOW_WIDTH/2,screenGeometry.x() + WIDTH_OFFSET) , screenGeometry.x() + screenGeometry.width() - WINDOW_WIDTH - WIDTH_OFFSET )
+        ypoint = max( min(mouse_pos.y()-WINDOW_HIGHT/2+HIGHT_OFFSET,screenGeometry.height()-WINDOW_HIGHT-100) , screenGeometry.y() + 10 )
+        self.move(QPoint(xpoint,ypoint))
+
+    def checkBudget(self,startup,extra=0):
+        elapsed = (perf_counter() - startup + extra) * 1000
+        budget = utils.Settings().advanced["startup_budget_ms"]
+        if budget and elapsed > budget:
+            utils.logger(f"Window opened in {elapsed:.0f} ms, budget is {budget} ms")
+
+    def refresh(self,kwargs):
+        '''
+        Bring hidden window back without rebuilding widgets
+        Only things that could change since last click are updated: viewport, camera, version, frame range
+        '''
+        startup = perf_counter()
+        try:
+            pane_changed = kwargs.get("pane") != self.kwargs.get("pane")
+            self.hou_viewport.cameraName()
+        except hou.ObjectWasDeleted:
+            pane_changed = True
+
+        if pane_changed:
+            self.hou_viewport = utils.HouViewport(kwargs)
+        self.kwargs = kwargs
+
+        settings = utils.Settings()
+        self.paths = settings.paths
+
+        self.frames_cache = {}
+        self.updateCameraLabel()
+        self.updateRamUsage()
+        self.requestProbes(flipbooks=True)
+
+        if not self.isVisible():
+            self.placeWindow()
+            self.show()
+        self.raise_()
+        self.activateWindow()
+        self.checkBudget(startup)
+
     def eventFilter(self, source , event) -> bool:
         if  event.type() == QEvent.FocusIn or \
             event.type() == QEvent.KeyRelease and \
@@ -422,7 +529,12 @@ class DinoWriter(QWidget):
 
     def updateFileFormat(self):
         state = self.convertvideo.isChecked()
-        if state:
+        # Streaming encode reads png or jpg only, so they can be picked instead of exr
+        if state and utils.Settings().advanced["streaming_encode"]:
+            self.fileformat.setDisabled(False)
+            if self.fileformat.currentText() not in utils.FFmpeg.PIPE_CODECS:
+                self.fileformat.setCurrentText("png")
+        elif state:
             self.fileformat.setCurrentText("exr")
             self.fileformat.setDisabled(True)
         else:
@@ -437,7 +549,7 @@ class DinoWriter(QWidget):
         fb_name = self.paths.get("fb_name")
         for name in fb_name.split("."):
             part = name.format(name=self.filename.text(),
-                                version=Fileparser.getVersion(self.filename.text()),
+                                version=self.version,
                                 fileformat=self.fileformat.currentText())
             
             if name == "{name}":
@@ -493,46 +605,97 @@ class DinoWriter(QWidget):
         self.framestart.setText(start)
         self.frameend.setText(end)
 
+    def expandFrame(self,text):
+        '''
+        Frame number from frame line text, expressions are expanded once per window show
+        '''
+        if text.lstrip("-").isdigit():
+            return int(text)
+        if text not in self.frames_cache:
+            self.frames_cache[text] = int(hou.text.expandString(text))
+        return self.frames_cache[text]
+
     def ramUsage(self):
-        pixels_count = int(self.resx.text()) * int(self.resy.text())
-        image_in_bytes = pixels_count * 4
-        image_in_mbytes = image_in_bytes / BYTES_TOLERANCE / BYTES_TOLERANCE
-        frame_range = max(int(hou.text.expandString(self.frameend.text())) - int(hou.text.expandString(self.framestart.text())) + 1,1)
-        mbytes = image_in_mbytes * frame_range
-        return mbytes
-    
+        '''
+        Returns (RAM, disk) estimation in MB
+        '''
+        resolution = (int(self.resx.text()), int(self.resy.text()))
+        frame_range = max(self.expandFrame(self.frameend.text()) - self.expandFrame(self.framestart.text()) + 1,1)
+        aspect = self.hou_viewport.cameraPixelAspect() if utils.Settings().advanced["aspect_affects_resolution"] else 1
+        ram, disk = self.estimator.estimate(resolution, frame_range, self.fileformat.currentText(), aspect=aspect)
+        return ram / BYTES_TOLERANCE / BYTES_TOLERANCE, disk / BYTES_TOLERANCE / BYTES_TOLERANCE
+
+    def formatSize(self,mbytes):
+        if mbytes<=BYTES_TOLERANCE:
+            return f"{mbytes:.2f} MB"
+        return f"{mbytes/BYTES_TOLERANCE :.2f} GB"
+
     def updateRamUsage(self):
-        ram = self.ramUsage()
-        if ram<=BYTES_TOLERANCE:
-            ramtext = f"RAM Usage: {ram:.2f} MB"
-        else:
-            ramtext = f"RAM Usage: {ram/BYTES_TOLERANCE :.2f} GB"
-        self.ramusage.setText(ramtext)
+        ram, disk = self.ramUsage()
+        self.ramusage.setText(f"RAM Usage: {self.formatSize(ram)}    Disk: {self.formatSize(disk)}")
 
-    def flipbooks_menu(self):
+    def requestProbes(self,flipbooks=False):
+        '''
+        Ask FsWorker for next version of current name and, optionally, for existing flipbooks
+        Paths are expanded here, in main thread, only disk access goes to background
+        '''
+        self.probe_timer.stop()
+        name = self.filename.text()
+        if len(name)==0:
+            self.applyProbe("version","v001")
+        else:
+            self.fs.submit("version",Fileparser.nextVersion,Fileparser.getFolder(name))
+
+        if flipbooks:
+            self.fs.submit("flipbooks",Fileparser.listFlipbooks,self.flipbooksFolder(),Fileparser.catalogPath())
+            self.fs.submit("thumbnails",Fileparser.listThumbnails,self.flipbooksFolder(),Fileparser.catalogPath(),Fileparser.thumbnailsPath())
+            self.fs.submit("calibration",self.estimator.calibrate,Fileparser.catalogPath(),self.flipbooksFolder())
+        elif len(name)!=0:
+            self.fs.submit("search",Fileparser.listFlipbooks,self.flipbooksFolder(),Fileparser.catalogPath(),name)
+
+    def applyProbe(self,name,result):
+        if name=="version" and result:
+            self.version = result
+            self.updateColorfulLabel()
+        elif name=="flipbooks":
+            self.flipbooks_menu(result)
+        elif name=="search" and result:
+            self.filename.setCompleter(widgets.Completer(result))
+        elif name=="calibration" and result:
+            self.estimator.calibration = result
+            self.updateRamUsage()
+        elif name=="thumbnails" and result:
+            self.thumbnails = result
+            self.menu_button.setImages(result)
+
+    def flipbooksFolder(self):
         fb_folder_raw = hou.text.expandString(self.paths.get("fb_folder")).format(name=self.data.get("name"))
-        pfolder = Path(fb_folder_raw).resolve().parent
+        return Path(fb_folder_raw).parent.as_posix()
 
-        if not pfolder.exists():
+    def flipbooks_menu(self,folders):
+        if folders is None:
+            pfolder = Path(self.flipbooksFolder())
             if not hou.ui.displayMessage(f"{Path(self.paths.get('fb_folder')).parent}\nNo folder found\nWanna create it?",buttons=("Yes","No")):
                 pfolder.mkdir(parents=True, exist_ok=True)
+                folders = []
             else:
                 utils.logger("No folder to write in flipbooks\nChange path or create folder")
                 self.close()
-                return []
+                return
 
-        folders = [x.name for x in pfolder.iterdir() if x.is_dir()]
-        return folders
+        self.filename.setCompleter(widgets.Completer(folders))
+        self.menu_button.setActions(folders,self.setMenuItemFile)
+        self.menu_button.setImages(self.thumbnails)
 
-    def get_tmp(self):
+    def get_tmp(self,create=False):
         hou_temp = Path(hou.text.expandString(self.paths.get("tmp_folder")))
 
-        if not hou_temp.exists():
+        if create:
             hou_temp.mkdir(parents=True, exist_ok=True)
 
         return hou_temp.as_posix()
 
-    def main(self):
+    def main(self,resume=False):
 
         # Check lineedits validness
         check_lines = [self.filename,self.resx,self.resy,self.framestart,self.frameend]
@@ -548,7 +711,7 @@ class DinoWriter(QWidget):
             return 0
 
         # Create data to store
-        hou_temp = self.get_tmp()
+        hou_temp = self.get_tmp(create=True)
         data = {
             "name": self.filename.text(),
             "resx": self.resx.text(),
@@ -565,11 +728,18 @@ class DinoWriter(QWidget):
         data_file = Path(hou_temp, self.paths.get("tmp_data")).as_posix()
         with open(data_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=4)
+        data["resume"] = resume
 
         # Proceed hip and start flipbook script
         self.close()
-        hou.hipFile.saveAndBackup()
-        flipbook.start(data,self.kwargs)
+        tracer = Fileparser.tracer()
+        try:
+            with tracer.span("save hip"):
+                hou.hipFile.saveAndBackup()
+            flipbook.start(data,self.kwargs,tracer)
+        finally:
+            if utils.Settings().advanced["trace"]:
+                tracer.write(Fileparser.tracePath(), chrome=utils.Settings().advanced["trace_chrome"])
 
     def load_json(self, file):
         try:
@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+class FlipbookCatalog:
+    """Local SQLite catalog of flipbooks
+
+    Keeps every written version with its frame range, resolution, format and size,
+    so "existing flipbooks" menu is filled from indexed queries instead of scanning preview folder.
+    Flipbooks written by other sessions are picked up by a shallow rescan, only when preview folder mtime changes.
+    Every call opens its own connection, so catalog can be used from worker threads.
+
+    Args:
+        path (str): Database file
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS roots(
+            root TEXT PRIMARY KEY,
+            mtime INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS flipbooks(
+            root TEXT NOT NULL,
+            name TEXT NOT NULL,
+            updated REAL,
+            PRIMARY KEY(root, name)
+        );
+        CREATE INDEX IF NOT EXISTS flipbooks_recent ON flipbooks(root, updated DESC);
+        CREATE TABLE IF NOT EXISTS versions(
+            root TEXT NOT NULL,
+            name TEXT NOT NULL,
+            version TEXT NOT NULL,
+            frame_start INTEGER,
+            frame_end INTEGER,
+            resx INTEGER,
+            resy INTEGER,
+            fileformat TEXT,
+            bytes INTEGER,
+            frame_bytes INTEGER,
+            frames INTEGER,
+            aspect REAL,
+            created REAL,
+            updated REAL,
+            thumbnail TEXT,
+            contact_sheet TEXT,
+            PRIMARY KEY(root, name, version)
+        );
+        CREATE INDEX IF NOT EXISTS versions_recent ON versions(root, updated DESC);
+    """
+
+    # Columns added after the first release, created on old databases by connect()
+    MIGRATIONS = {
+        "versions": {"thumbnail": "TEXT", "contact_sheet": "TEXT", "frame_bytes": "INTEGER",
+                     "frames": "INTEGER", "aspect": "REAL"},
+    }
+    _migrated = set()
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+
+    @contextmanager
+    def connect(self):
+        """Connection which commits on success and is always closed"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path.as_posix(), timeout=10)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.SCHEMA)
+            self._migrate(connection)
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def record(self, root: str, name: str, version: str, frame_start: int, frame_end: int,
+               resolution: tuple, fileformat: str, bytes: int, frame_bytes: int = None,
+               frames: int = None, aspect: float = None) -> None:
+        """Add or update written version
+
+        Args:
+            bytes (int): Size of everything in version folder
+            frame_bytes (int, optional): Size of image sequence only, kept from previous record if not set
+            frames (int, optional): Rendered frames in frame_bytes, kept from previous record if not set
+            aspect (float, optional): Pixel aspect FlipbookEstimator applied to width, kept from previous record if not set
+        """
+        now = time.time()
+        with self.connect() as db:
+            db.execute("""
+                INSERT INTO versions(root, name, version, frame_start, frame_end, resx, resy,
+                                     fileformat, bytes, frame_bytes, frames, aspect, created, updated)
+                VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                ON CONFLICT(root, name, version) DO UPDATE SET
+                    frame_start=excluded.frame_start, frame_end=excluded.frame_end,
+                    resx=excluded.resx, resy=excluded.resy, fileformat=excluded.fileformat,
+                    bytes=excluded.bytes, updated=excluded.updated,
+                    frame_bytes=COALESCE(excluded.frame_bytes, versions.frame_bytes),
+                    frames=COALESCE(excluded.frames, versions.frames), aspect=COALESCE(excluded.aspect, versions.aspect)
+                """, (root, name, version, int(frame_start), int(frame_end),
+                      int(resolution[0]), int(resolution[1]), fileformat, int(bytes),
+                      frame_bytes, frames, aspect, now, now))
+            db.execute("""
+                INSERT INTO flipbooks VALUES(?,?,?)
+                ON CONFLICT(root, name) DO UPDATE SET updated=excluded.updated
+                """, (root, name, now))
+
+    def setImages(self, root: str, name: str, version: str, thumbnail: str = None, contact_sheet: str = None) -> None:
+        """Store ThumbnailCache keys of version"""
+        with self.connect() as db:
+            db.execute("""
+                UPDATE versions SET thumbnail=?, contact_sheet=? WHERE root=? AND name=? AND version=?
+                """, (thumbnail, contact_sheet, root, name, version))
+
+    def images(self, root: str) -> dict:
+        """{name: (thumbnail key, contact sheet key)} of the most recent version of every flipbook in root"""
+        with self.connect() as db:
+            rows = db.execute("""
+                SELECT name, thumbnail, contact_sheet, MAX(updated) FROM versions
+                WHERE root=? AND thumbnail IS NOT NULL GROUP BY name
+                """, (root,))
+            return {x["name"]: (x["thumbnail"], x["contact_sheet"]) for x in rows}
+
+    def bytesPerPixel(self, root: str) -> dict:
+        """{fileformat: average bytes per pixel on disk} of image sequences written to root
+
+        Only rendered frames are counted, pixels use the same aspect as FlipbookEstimator.estimate.
+        Versions recorded without frame count are skipped.
+        """
+        with self.connect() as db:
+            rows = db.execute("""
+                SELECT fileformat, SUM(frame_bytes) AS bytes,
+                       SUM(frames * CAST(resx * COALESCE(aspect, 1) AS INTEGER) * resy) AS pixels
+                FROM versions WHERE root=? AND frame_bytes > 0 AND frames > 0 GROUP BY fileformat
+                """, (root,))
+            return {x["fileformat"]: x["bytes"] / x["pixels"] for x in rows if x["pixels"]}
+
+    def sync(self, root: str) -> None:
+        """Pick up flipbook folders created outside of this catalog, rescans root only if its mtime changed"""
+        try:
+            mtime = os.stat(root).st_mtime_ns
+        except OSError:
+            return
+
+        with self.connect() as db:
+            row = db.execute("SELECT mtime FROM roots WHERE root=?", (root,)).fetchone()
+            if row and row["mtime"] == mtime:
+                return
+
+            known = {x["name"] for x in db.execute("SELECT name FROM flipbooks WHERE root=?", (root,))}
+            found = {}
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        found[entry.name] = entry
+            new = [(root, name, found[name].stat().st_mtime) for name in found.keys() - known]
+            db.executemany("INSERT INTO flipbooks VALUES(?,?,?)", new)
+
+            gone = [(root, name) for name in known - found.keys()]
+            db.executemany("DELETE FROM flipbooks WHERE root=? AND name=?", gone)
+            db.executemany("DELETE FROM versions WHERE root=? AND name=?", gone)
+
+            db.execute("INSERT OR REPLACE INTO roots VALUES(?,?)", (root, mtime))
+
+    def names(self, root: str, search: str = "", limit: int = 500) -> list:
+        """Flipbook names in root, most recent first, optionally filtered by substring"""
+        pattern = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        with self.connect() as db:
+            rows = db.execute("""
+                SELECT name FROM flipbooks
+                WHERE root=? AND name LIKE ? ESCAPE '\\'
+                ORDER BY updated DESC LIMIT ?
+                """, (root, f"%{pattern}%", limit))
+            return [x["name"] for x in rows]
+
+    def versions(self, root: str, name: str) -> list:
+        """Recorded versions of flipbook as dicts, most recent first"""
+        with self.connect() as db:
+            rows = db.execute("""
+                SELECT * FROM versions WHERE root=? AND name=? ORDER BY updated DESC
+                """, (root, name))
+            return [dict(x) for x in rows]
+
+    def _migrate(self, connection: sqlite3.Connection) -> None:
+        key = self.path.as_posix()
+        if key in self._migrated:
+            return
+        for table, columns in self.MIGRATIONS.items():
+            existing = {x[1] for x in connection.execute(f"PRAGMA table_info({table})")}
+            for column, kind in columns.items():
+                if column not in existing:
+                    connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+        connection.commit()
+        self._migrated.add(key)
@@ -0,0 +1,141 @@
+"""Performance history of flipbooks
+
+One summary record per flipbook is appended as a JSON line to a local file.
+Module doesn't need Houdini, report runs from any Python 3:
+
+    python -m DinoWrite.utils.history $TEMP/houdini_temp/flipbook_writer/history.jsonl --by host
+"""
+import argparse
+import getpass
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+from pathlib import Path
+
+class PerformanceHistory:
+    """Append-only JSONL store of flipbook summaries
+
+    Every record is written with one append, so several Houdini sessions can share the file.
+    Broken lines (killed session) are skipped on read.
+
+    Args:
+        path (str): JSONL file
+    """
+    GROUPS = ("name", "host", "preset", "deliverables", "fileformat", "user")
+    METRICS = ("render_fps", "encode_fps", "bytes_per_frame")
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+
+    def append(self, record: dict) -> None:
+        record = {"time": time.time(), "host": socket.gethostname(), "user": getpass.getuser(), **record}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def records(self) -> list:
+        records = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return records
+
+    @staticmethod
+    def metrics(record: dict) -> dict:
+        """Derived render fps, encode fps and bytes per frame of record, None where unknown"""
+        frames = record.get("frames") or 0
+        def rate(seconds):
+            return frames / seconds if frames and seconds else None
+        return {
+            "render_fps": rate(record.get("render_seconds")),
+            "encode_fps": rate(record.get("encode_seconds")),
+            "bytes_per_frame": record["frame_bytes"] / frames if frames and record.get("frame_bytes") else None,
+        }
+
+    def report(self, by: str = "name") -> dict:
+        """{group: {"runs": n, metric: median}}"""
+        groups = {}
+        for record in self.records():
+            groups.setdefault(str(record.get(by)), []).append(self.metrics(record))
+        report = {}
+        for group, metrics in sorted(groups.items()):
+            report[group] = {"runs": len(metrics)}
+            for metric in self.METRICS:
+                values = [x[metric] for x in metrics if x[metric] is not None]
+                report[group][metric] = statistics.median(values) if values else None
+        return report
+
+    def regressions(self, by: str = "name", threshold: float = 1.5, min_history: int = 3) -> list:
+        """Runs with render or encode fps lower than median of previous runs of the same group divided by threshold
+
+        Returns:
+            list: [(record, metric, value, median)]
+        """
+        history = {}
+        found = []
+        for record in sorted(self.records(), key=lambda x: x.get("time", 0)):
+            metrics = self.metrics(record)
+            previous = history.setdefault(str(record.get(by)), {"render_fps": [], "encode_fps": []})
+            for metric, values in previous.items():
+                value = metrics[metric]
+                if value is None:
+                    continue
+                if len(values) >= min_history:
+                    median = statistics.median(values)
+                    if value * threshold < median:
+                        found.append((record, metric, value, median))
+                values.append(value)
+        return found
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Flipbook performance report")
+    parser.add_argument("path", help="history.jsonl from DinoWrite tmp_folder")
+    parser.add_argument("--by", default="name", choices=PerformanceHistory.GROUPS, help="Group runs by field")
+    parser.add_argument("--threshold", type=float, default=1.5, help="Flag runs this many times slower than their history")
+    parser.add_argument("--min-history", type=int, default=3, help="Runs needed before a group is checked")
+    args = parser.parse_args(argv)
+
+    history = PerformanceHistory(args.path)
+    report = history.report(args.by)
+    if not report:
+        print(f"No records in {args.path}")
+        return 1
+
+    columns = (args.by, "runs") + PerformanceHistory.METRICS
+    rows = [columns] + [(group,) + tuple(_format(x[c]) for c in columns[1:]) for group, x in report.items()]
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print("  ".join(str(x).ljust(w) for x, w in zip(row, widths)).rstrip())
+
+    regressions = history.regressions(args.by, args.threshold, args.min_history)
+    if regressions:
+        print(f"\nRuns slower than history / {args.threshold}:")
+        for record, metric, value, median in regressions:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(record.get("time", 0)))
+            print(f"  {when}  {record.get('name')} {record.get('version')} on {record.get('host')}: "
+                  f"{metric} {value:.2f}, median {median:.2f}")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
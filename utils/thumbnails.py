@@ -0,0 +1,109 @@
+import hashlib
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+class ThumbnailCache:
+    """Content-addressed cache of flipbook thumbnails and contact sheets
+
+    Images are made with ffmpeg once, right after the flipbook is written, and stored as
+    "{folder}/{key[:2]}/{key}.{kind}.jpg". Key is a hash of the source frame content,
+    so the same frame is never converted twice. Cache is kept under max_bytes by
+    evicting least recently used images, every get() refreshes image mtime.
+
+    Args:
+        folder (str): Cache folder
+        max_bytes (int): Max size of the cache
+    """
+    def __init__(self, folder: str, max_bytes: int = 256*1024*1024) -> None:
+        self.folder = Path(folder)
+        self.max_bytes = max_bytes
+
+    def key(self, frame: str) -> str:
+        digest = hashlib.sha1()
+        with open(frame, "rb") as f:
+            for chunk in iter(lambda: f.read(1024*1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, key: str, kind: str = "thumb") -> Path:
+        return self.folder / key[:2] / f"{key}.{kind}.jpg"
+
+    def get(self, key: str, kind: str = "thumb") -> str:
+        """Cached image path or None, marks image as recently used"""
+        if not key:
+            return None
+        path = self.path(key, kind)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path.as_posix()
+
+    def thumbnail(self, frame: str, size: int = 160) -> str:
+        """Make thumbnail of frame if not cached yet, returns key or None"""
+        key = self.key(frame)
+        if self.get(key):
+            return key
+
+        commands = ["-i", frame, "-vf", f"scale={size}:-2", "-frames:v", "1"]
+        if Path(frame).suffix == ".exr":
+            commands = ["-apply_trc", "iec61966_2_1"] + commands
+        return key if self._ffmpeg(commands, self.path(key)) else None
+
+    def contact_sheet(self, key: str, frames: list, size: int = 160, tiles: str = "4x3") -> str:
+        """Make contact sheet of evenly spaced frame files under thumbnail key
+
+        Only the picked frames are listed for ffmpeg concat demuxer, so the rest of the sequence is never decoded.
+        """
+        if self.get(key, "sheet"):
+            return key
+        if not frames:
+            return None
+
+        columns, rows = [int(x) for x in tiles.split("x")]
+        count = min(columns*rows, len(frames))
+        picked = [frames[i*len(frames)//count] for i in range(count)]
+
+        output = self.path(key, "sheet")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        listfile = output.with_suffix(".txt")
+        with open(listfile, "w", encoding="utf-8") as f:
+            f.writelines(f"file '{Path(x).as_posix()}'\n" for x in picked)
+
+        commands = ["-f", "concat", "-safe", "0", "-i", listfile.as_posix(),
+                    "-vf", f"scale={size}:-2,tile={tiles}", "-frames:v", "1"]
+        if Path(picked[0]).suffix == ".exr":
+            commands = ["-apply_trc", "iec61966_2_1"] + commands
+        try:
+            return key if self._ffmpeg(commands, output) else None
+        finally:
+            listfile.unlink(missing_ok=True)
+
+    def evict(self) -> None:
+        """Remove least recently used images until cache fits max_bytes"""
+        images = []
+        for path in self.folder.glob("*/*.jpg"):
+            stat = path.stat()
+            images.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(x[1] for x in images)
+        for _, size, path in sorted(images):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def _ffmpeg(self, commands: list, output: Path) -> bool:
+        if not shutil.which("ffmpeg"):
+            return False
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        temp = output.with_suffix(".tmp.jpg")
+        result = subprocess.run(["ffmpeg", "-y", "-loglevel", "error"] + commands + [temp.as_posix()])
+        if result.returncode != 0 or not temp.exists():
+            temp.unlink(missing_ok=True)
+            return False
+        os.replace(temp, output)
+        return True
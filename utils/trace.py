@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+class Span:
+    """Running span, ended by end() or by leaving `with` block"""
+    def __init__(self, tracer, name: str, args: dict) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = time.perf_counter_ns()
+
+    def end(self) -> None:
+        if self.start is None:
+            return
+        self.tracer.spans.append({
+            "name": self.name,
+            "start_ms": (self.start - self.tracer.origin) / 1e6,
+            "duration_ms": (time.perf_counter_ns() - self.start) / 1e6,
+            "thread": threading.get_ident(),
+            "args": self.args,
+        })
+        self.start = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.end()
+
+class _NullSpan:
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+class Tracer:
+    """Timing spans of one flipbook run
+
+    `with tracer.span("render"):` records wall time of the block, long linear stages
+    can be ended with `span.end()` instead. Run is appended as one JSON line to jsonl file
+    and optionally saved as Chrome trace_event file, which opens in chrome://tracing
+    or ui.perfetto.dev. Disabled tracer returns the same empty span every time and writes nothing.
+
+    Args:
+        name (str): Run name
+        enabled (bool): Record spans
+    """
+    _null = _NullSpan()
+
+    def __init__(self, name: str = "flipbook", enabled: bool = True) -> None:
+        self.name = name
+        self.enabled = enabled
+        self.run = uuid.uuid4().hex[:12]
+        self.time = time.time()
+        self.origin = time.perf_counter_ns()
+        self.spans = []
+
+    def span(self, name: str, **args):
+        if not self.enabled:
+            return self._null
+        return Span(self, name, args)
+
+    def durations(self) -> dict:
+        """{span name: seconds}, spans with the same name are summed"""
+        durations = {}
+        for x in self.spans:
+            durations[x["name"]] = durations.get(x["name"], 0) + x["duration_ms"] / 1000
+        return durations
+
+    def record(self) -> dict:
+        return {
+            "run": self.run,
+            "name": self.name,
+            "time": self.time,
+            "total_ms": (time.perf_counter_ns() - self.origin) / 1e6,
+            "spans": sorted(self.spans, key=lambda x: x["start_ms"]),
+        }
+
+    def chrome(self) -> dict:
+        """Spans as Chrome trace_event complete events"""
+        pid = os.getpid()
+        events = [{"name": x["name"], "ph": "X", "pid": pid, "tid": x["thread"],
+                   "ts": x["start_ms"] * 1000, "dur": x["duration_ms"] * 1000, "args": x["args"]}
+                  for x in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"run": self.run, "name": self.name}}
+
+    def write(self, jsonl: str, chrome: bool = False) -> None:
+        """Append run to jsonl file, chrome trace goes next to it as "{stem}_{run}.json" """
+        if not self.enabled:
+            return
+        path = Path(jsonl)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.record()) + "\n")
+        if chrome:
+            with open(path.with_name(f"{path.stem}_{self.run}.json"), "w", encoding="utf-8") as f:
+                json.dump(self.chrome(), f)
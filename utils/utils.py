@@ -3,9 +3,21 @@ import json
 from pathlib import Path
 import subprocess
 from os import environ as osenviron
+import os
 import random
 import shutil
-from pxr import Sdf,Usd
+import threading
+import queue
+import time
+import re
+import hashlib
+import sqlite3
+
+from .catalog import FlipbookCatalog
+from .thumbnails import ThumbnailCache
+from .verify import FrameVerifier
+from .trace import Tracer
+from .history import PerformanceHistory
 
 from PySide2.QtWidgets import *
 from PySide2.QtGui import *
@@ -28,6 +40,19 @@ def logger(message:str,length=70) -> None:
         print(message)
         print(f"{'-'*length}")
 
+def frame_path(sequence: str, padding: str, frame: int) -> str:
+    """Expand frame padding in sequence path
+
+    Args:
+        sequence (str): Path with padding like "name.v001.$F4.exr"
+        padding (str): Padding token like "$F4"
+        frame (int): Frame number
+
+    Returns:
+        str: Path like "name.v001.0012.exr"
+    """
+    return sequence.replace(padding, str(int(frame)).zfill(int(padding[2:])))
+
 def hmsg(message:str,buttons=("Sorry,Dino!",),level="message") -> None:
     """Houdini message window 
 
@@ -47,11 +72,194 @@ def hmsg(message:str,buttons=("Sorry,Dino!",),level="message") -> None:
     else:
         logger("No message set in hsmg function")
 
+class JsonFile:
+    """JSON file parsed once per process and re-read only when its mtime changes
+
+    Parsed data is cached per path and shared by every instance.
+    Missing file gives an empty dict.
+    """
+    _cache = {}
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+
+    @property
+    def data(self) -> dict:
+        key = self.path.as_posix()
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return {}
+
+        cached = self._cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(self.path) as f:
+            data = json.load(f)
+        self.loaded(data)
+
+        self._cache[key] = (mtime, data)
+        return data
+
+    def loaded(self, data: dict) -> None:
+        """Called once per (re)load with freshly parsed data"""
+        pass
+
+class Settings(JsonFile):
+    """settings.json of DinoWrite with validation and typed access to its sections"""
+
+    SECTIONS = {
+        "paths": dict,
+        "formats": dict,
+        "custom_resolution": list,
+        "custom_framerange": dict,
+        "ffmpeg_cmd": (list, dict),
+        "advanced": dict,
+    }
+    PATHS = ("fb_folder", "fb_name", "tmp_folder", "tmp_data", "fb_video_ext")
+    ADVANCED = {
+        "delete_incomplete_fb": False,
+        "version_reserve_retries": 20,
+        "conversion_delete_input_sequence": True,
+        "streaming_encode": False,
+        "background_encode": True,
+        "encode_queue_size": 4,
+        "encode_workers": 1,
+        "encode_min_segment": 100,
+        "aspect_affects_resolution": False,
+        "startup_budget_ms": 300,
+        "thumbnail_size": 160,
+        "thumbnail_cache_mb": 256,
+        "contact_sheet": False,
+        "contact_sheet_tiles": "4x3",
+        "metadata": [],
+        "fill_missing_frames": False,
+        "verify_frames": False,
+        "verify_workers": 0,
+        "render_monitor": False,
+        "history": True,
+        "trace": False,
+        "trace_chrome": False,
+        "preflight": True,
+        "preflight_ram_warn_pct": 60,
+        "preflight_ram_block_pct": 90,
+        "preflight_disk_warn_pct": 80,
+        "preflight_disk_block_pct": 100,
+        "preflight_mplay_auto_off": True,
+    }
+
+    def __init__(self, path=None) -> None:
+        super().__init__(path or Path(__file__).parents[1] / "settings.json")
+
+    def validate(self, data: dict) -> list:
+        """Schema errors of settings data, empty list if everything is fine"""
+        errors = []
+        for section, kind in self.SECTIONS.items():
+            if section not in data:
+                errors.append(f"Missing section '{section}'")
+            elif not isinstance(data[section], kind):
+                errors.append(f"Section '{section}' has wrong type {type(data[section]).__name__}")
+        if errors:
+            return errors
+
+        for key in self.PATHS:
+            if not isinstance(data["paths"].get(key), str):
+                errors.append(f"Missing 'paths.{key}'")
+        if not re.search(r"\$F\d+", data["paths"].get("fb_name") or ""):
+            errors.append("No frame padding like '$F4' in 'paths.fb_name'")
+
+        for key in ("video_exts", "pic_exts"):
+            if not isinstance(data["formats"].get(key), list):
+                errors.append(f"Missing 'formats.{key}' list")
+
+        ffmpeg_cmd = data["ffmpeg_cmd"]
+        if isinstance(ffmpeg_cmd, dict):
+            if not isinstance(ffmpeg_cmd.get("input"), list) or not isinstance(ffmpeg_cmd.get("outputs"), list):
+                errors.append("'ffmpeg_cmd' should have 'input' and 'outputs' lists")
+            elif not [x for x in ffmpeg_cmd["outputs"] if x.get("enabled", True)]:
+                errors.append("No enabled outputs in 'ffmpeg_cmd'")
+
+        for key, value in data["advanced"].items():
+            default = self.ADVANCED.get(key)
+            if default is None:
+                continue
+            # Numbers may be written as int or float, bool is an int subclass so it is checked strictly
+            if isinstance(default, (int, float)) and not isinstance(default, bool):
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+            else:
+                valid = type(value) is type(default)
+            if not valid:
+                errors.append(f"'advanced.{key}' should be {type(default).__name__}")
+
+        return errors
+
+    def loaded(self, data: dict) -> None:
+        errors = self.validate(data)
+        if errors:
+            message = f"Bad settings file\n{self.path.as_posix()}\n\n" + "\n".join(errors)
+            logger(message)
+            raise ValueError(message)
+
+    @property
+    def paths(self) -> dict:
+        return self.data["paths"]
+
+    @property
+    def formats(self) -> dict:
+        return self.data["formats"]
+
+    @property
+    def custom_resolution(self) -> list:
+        return self.data["custom_resolution"]
+
+    @property
+    def custom_framerange(self) -> dict:
+        return self.data["custom_framerange"]
+
+    @property
+    def ffmpeg_cmd(self):
+        return self.data["ffmpeg_cmd"]
+
+    @property
+    def advanced(self) -> dict:
+        return {**self.ADVANCED, **self.data["advanced"]}
+
 class StyleSheet:
     """Parsing info from stylesheet json file
+
+    Whole theme is compiled to QSS strings once and cached by file hash,
+    so getting a style never touches the disk.
     """
+    _bundles = {}
+    _hashes = {}
+
     def __init__(self, config_path: str) -> None:
         self.config_path = config_path
+        self.bundle = self.compile(config_path)
+
+    @classmethod
+    def compile(cls, config_path: str) -> dict:
+        """Compiled theme of stylesheet file, {element: QSS string} and raw "main" settings"""
+        key = Path(config_path).as_posix()
+        digest = cls._hashes.get(key)
+        if digest in cls._bundles:
+            return cls._bundles[digest]
+
+        raw = Path(config_path).read_bytes()
+        digest = hashlib.sha1(raw).hexdigest()
+        if digest not in cls._bundles:
+            bundle = {}
+            for element, selectors in json.loads(raw).items():
+                if element == "main":
+                    bundle[element] = selectors
+                else:
+                    bundle[element] = "".join(f"{selector}{{{''.join(rules)}}}".replace("'", "")
+                                              for selector, rules in selectors.items())
+            cls._bundles[digest] = bundle
+
+        cls._hashes[key] = digest
+        return cls._bundles[digest]
 
     def get(self, element: str) -> str:
         """Get element from stylesheet file
@@ -62,22 +270,7 @@ class StyleSheet:
         Returns:
             str: Stylesheet style string
         """
-        data = {}
-        with open(self.config_path) as theme:
-            data = json.load(theme)
-
-        if element != "main":
-            label_style = data[element]
-            style = ""
-            for i in label_style:
-                data = label_style[i]
-                settings = ""
-                for j in data:
-                    settings += j
-                style += f"{i}{ {settings} }".replace("'", "")
-            return style
-        else:
-            return data[element]
+        return self.bundle[element]
 
 class FFmpeg:
     """Wrapper around ffmpeg
@@ -105,52 +298,836 @@ class FFmpeg:
         else:
             hmsg(f"No ffmpeg found in system PATH env")
 
+    def template(self):
+        """Raw ffmpeg_cmd from settings: list of args or dict with "input" args and "outputs" list"""
+        if not self.cmdvar:
+            return JsonFile(self.config_path).data['cmd']
+        return self.cmdvar
+
+    def deliverables(self) -> list:
+        """Enabled outputs of multi-output ffmpeg_cmd, empty list for plain args list"""
+        template = self.template()
+        if not isinstance(template, dict):
+            return []
+        return [x for x in template.get("outputs", []) if x.get("enabled", True)]
+
+    def presets(self) -> list:
+        """Encoder -preset value of every enabled output, "default" where it is not set"""
+        deliverables = self.deliverables()
+        groups = [x.get("args", []) for x in deliverables] if deliverables else [self.template() or []]
+        presets = []
+        for args in groups:
+            tokens = " ".join(str(x) for x in args).split()
+            presets.append(tokens[tokens.index("-preset") + 1] if "-preset" in tokens[:-1] else "default")
+        return presets
+
+    def outputs(self, output: str) -> list:
+        """Paths of every video written by one run
+
+        Output of plain args list is used as is. For multi-output settings each deliverable
+        gets "suffix" and "ext" applied to output, like "name.v001_proxy.mp4"
+        """
+        deliverables = self.deliverables()
+        if not deliverables:
+            return [output]
+
+        output = Path(output)
+        return [(output.parent / f"{output.stem}{x.get('suffix', '')}.{x.get('ext', output.suffix[1:])}").as_posix()
+                for x in deliverables]
+
     def cmd(self, fps=24, resolution="1920x1080", aspect=1, start_frame=1001, input="", output="") -> list:
 
         if input == "" or output == "":
             logger("No input or output set")
             return 0
 
-        commands = []
-        if not self.cmdvar:
-            data = {}
-            with open(self.config_path) as cmd:
-                data = json.load(cmd)
+        template = self.template()
+        keys = dict(fps=fps, resolution=resolution, aspect=aspect,
+                    start_frame=start_frame, input=input, output=output)
 
-            for key in data['cmd']:
-                nkey = key.format(fps=fps, resolution=resolution, aspect=aspect,
-                                start_frame=start_frame, input=input, output=output)
-                commands += nkey.split(" ")
-        else:
-            for key in self.cmdvar:
-                nkey = key.format(fps=fps, resolution=resolution, aspect=aspect,
-                                start_frame=start_frame, input=input, output=output)
+        commands = []
+        if not isinstance(template, dict):
+            for key in template:
+                nkey = key.format(**keys)
                 commands += nkey.split(" ")
+            return commands
+
+        # Multi-output: decode input once, split it and scale every branch in one filter graph
+        for key in template.get("input", []):
+            commands += key.format(**keys).split(" ")
+
+        deliverables = self.deliverables()
+        outputs = self.outputs(output)
+        width, height = [int(x) for x in resolution.split("x")]
+
+        branches = "".join(f"[s{i}]" for i in range(len(deliverables)))
+        graph = [f"[0:v]split={len(deliverables)}{branches}"]
+        sizes = []
+        for i, deliverable in enumerate(deliverables):
+            scale = float(deliverable.get("scale", 1))
+            # libx264 with yuv420p wants even sizes
+            size = (max(int(width*scale)//2*2, 2), max(int(height*scale)//2*2, 2))
+            graph.append(f"[s{i}]scale={size[0]}:{size[1]}[v{i}]")
+            sizes.append(size)
+        commands += ["-filter_complex", ";".join(graph)]
+
+        for i, deliverable in enumerate(deliverables):
+            keys.update(resolution=f"{sizes[i][0]}x{sizes[i][1]}", output=outputs[i])
+            commands += ["-map", f"[v{i}]"]
+            for key in deliverable.get("args", []):
+                commands += key.format(**keys).split(" ")
+            commands.append(outputs[i])
+
+        return commands
+
+    # Formats ffmpeg can split from a concatenated stream, there is no exr parser for image2pipe
+    PIPE_CODECS = {"jpg": "mjpeg", "png": "png"}
+
+    def streamable(self, fileformat: str) -> bool:
+        return fileformat in self.PIPE_CODECS
+
+    def pipe_cmd(self, fps=24, resolution="1920x1080", aspect=1, fileformat="png", output="") -> list:
+        """Same command as cmd() but reading images from stdin instead of a sequence on disk, 0 for not streamable format"""
+        if not self.streamable(fileformat):
+            return 0
+        commands = self.cmd(fps=fps, resolution=resolution, aspect=aspect,
+                            start_frame=0, input="pipe:0", output=output)
+        if not commands:
+            return 0
+
+        if "-start_number" in commands:
+            index = commands.index("-start_number")
+            del commands[index:index+2]
+
+        index = commands.index("-i")
+        commands[index:index] = ["-f", "image2pipe", "-c:v", self.PIPE_CODECS[fileformat]]
 
         return commands
 
-    def convert_to_video(self, fps=24, resolution="1920x1080", aspect=1, start_frame=1001, input="", output="", delete_input=False):
+    def segments(self, start_frame: int, end_frame: int, workers: int = 0, min_segment: int = 100) -> list:
+        """Split frame range into contiguous segments
+
+        Args:
+            workers (int, optional): Max number of segments, 0 means number of cpu cores. Defaults to 0.
+            min_segment (int, optional): Min frames in segment. Defaults to 100.
+
+        Returns:
+            list: (first frame, frames count) tuples
+        """
+        length = int(end_frame) - int(start_frame) + 1
+        workers = workers if workers > 0 else (os.cpu_count() or 1)
+        count = max(1, min(workers, length // max(int(min_segment), 1)))
+        # Even split, first segments take the remainder, so none is shorter than min_segment
+        size, extra = divmod(length, count)
+        segments = []
+        frame = int(start_frame)
+        for i in range(count):
+            frames = size + (1 if i < extra else 0)
+            segments.append((frame, frames))
+            frame += frames
+        return segments
+
+    def parallel_stages(self, fps=24, resolution="1920x1080", aspect=1, start_frame=1001, end_frame=1001, input="", output="", workers=0, min_segment=100):
+        """Commands to encode segments in parallel and join them with concat demuxer without re-encoding
+
+        Returns:
+            tuple: (stages, temp_files, files), stages is a list of commands lists, commands of one stage run at the same time.
+                files is {path: text} of concat lists, written by EncodeJob when it starts
+        """
+        segments = self.segments(start_frame, end_frame, workers, min_segment)
+        threads = max(1, (os.cpu_count() or 1) // len(segments))
+        output = Path(output)
+        outputs = self.outputs(output.as_posix())
+
+        encode = []
+        parts = [[] for _ in outputs]
+        for i, (frame, frames) in enumerate(segments):
+            segment = (output.parent / f"{output.stem}.part{i:03d}{output.suffix}").as_posix()
+            commands = self.cmd(fps=fps, resolution=resolution, aspect=aspect,
+                                start_frame=frame, input=input, output=segment)
+            if not commands:
+                return [], [], {}
+
+            for k, path in enumerate(self.outputs(segment)):
+                index = len(commands) - 1 - commands[::-1].index(path)
+                commands[index:index] = ["-frames:v", str(frames), "-threads", str(threads)]
+                parts[k].append(path)
+            encode.append(commands)
+
+        concat = []
+        temp_files = []
+        files = {}
+        for k, path in enumerate(outputs):
+            listfile = Path(path).with_suffix(".concat.txt").as_posix()
+            files[listfile] = "".join(f"file '{Path(x).name}'\n" for x in parts[k])
+            concat.append(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", listfile, "-c", "copy", path])
+            temp_files += parts[k] + [listfile]
+
+        return [encode, concat], temp_files, files
+
+    def job(self, fps=24, resolution="1920x1080", aspect=1, start_frame=1001, end_frame=None, input="", output="", workers=1, min_segment=100, on_done=None):
+        """EncodeJob for conversion, segment-parallel if workers isn't 1 and end_frame is set"""
+        if end_frame is not None and workers != 1:
+            stages, temp_files, files = self.parallel_stages(fps=fps, resolution=resolution, aspect=aspect,
+                                                      start_frame=start_frame, end_frame=end_frame,
+                                                      input=input, output=output,
+                                                      workers=workers, min_segment=min_segment)
+            if stages and len(stages[0]) > 1:
+                return EncodeJob(None, output, on_done=on_done, outputs=self.outputs(output),
+                                 stages=stages, temp_files=temp_files, files=files,
+                                 total_frames=int(end_frame) - int(start_frame) + 1)
+
         ffmpeg_cmd = self.cmd(fps=fps, resolution=resolution, aspect=aspect,
                             start_frame=start_frame, input=input, output=output)
-        
-        folder = Path(input).parent
-        if folder.exists():
-            files = [x for x in folder.iterdir()]
+        if not ffmpeg_cmd:
+            return None
+        return EncodeJob(ffmpeg_cmd, output, on_done=on_done, outputs=self.outputs(output),
+                         total_frames=int(end_frame) - int(start_frame) + 1 if end_frame is not None else None)
+
+    def convert_to_video(self, fps=24, resolution="1920x1080", aspect=1, start_frame=1001, input="", output="", delete_input=False, end_frame=None, workers=1, min_segment=100, files=None, progress=None):
+        """Convert sequence to video, files are deleted after with delete_input, every file of input folder by default
+
+        Args:
+            progress (callable, optional): Called about 10 times a second from the calling thread as
+                `progress(job.progress)` while ffmpeg runs. Returning False cancels the encode
+                and removes the partial video.
+        """
+        if files is None:
+            folder = Path(input).parent
+            files = [x for x in folder.iterdir()] if folder.exists() else []
+
+        job = self.job(fps=fps, resolution=resolution, aspect=aspect, start_frame=start_frame,
+                       end_frame=end_frame, input=input, output=output,
+                       workers=workers, min_segment=min_segment)
+        if not job:
+            return 0
+
+        if progress is None:
+            job.run()
         else:
-            files = []
+            worker = threading.Thread(target=job.run, daemon=True)
+            worker.start()
+            while worker.is_alive():
+                worker.join(0.1)
+                if progress(dict(job.progress)) is False:
+                    job.cancel()
+                    worker.join()
+                    logger(f"Encode cancelled, partial video removed\n{output}")
 
-        try:
-            # subprocess.run(ffmpeg_cmd, check=True, shell=True)
-            subprocess.run(ffmpeg_cmd, check=True)
-        except subprocess.CalledProcessError as e:
-            logger(f"Error occured during subprocces run ffmpeg command\n\nErrorLog:\n{e}")
+        if job.status != "done":
             return 0
 
         if len(files) != 0 and delete_input:
             for file in files:
-                file.unlink()
+                file.unlink(missing_ok=True)
+        return 1
+
+    def submit(self, fps=24, resolution="1920x1080", aspect=1, start_frame=1001, input="", output="", on_done=None, queue_size=4, end_frame=None, workers=1, min_segment=100):
+        """Queue conversion in the session EncodeJobManager, returns EncodeJob or None if the queue is full"""
+        job = self.job(fps=fps, resolution=resolution, aspect=aspect, start_frame=start_frame,
+                       end_frame=end_frame, input=input, output=output,
+                       workers=workers, min_segment=min_segment, on_done=on_done)
+        if job and EncodeJobManager.instance(queue_size).submit(job):
+            return job
+
+class EncodeJob:
+    """ffmpeg conversion which can run in background
+
+    Args:
+        commands (list): ffmpeg command
+        output (str): Video file which will be written
+        on_done (callable, optional): Called in the main thread as `on_done(job)` after the job is over
+        outputs (list, optional): Every file written by the job, removed on cancel. Defaults to [output].
+        stages (list, optional): Lists of commands instead of single command. Commands of one stage
+            run at the same time, stages run one after another.
+        temp_files (list, optional): Files removed after the job is over
+        files (dict, optional): {path: text} written when the job starts, so a rejected job leaves nothing on disk
+        total_frames (int, optional): Frames to encode, for percent and ETA in progress
+
+    ffmpeg runs with `-progress pipe:1`, job.progress holds the latest
+    {"frame", "total", "fps", "speed", "eta", "percent", "stage"} of running stage.
+    Encoding is over once segments are joined, so later stages report 100 percent.
+    """
+    def __init__(self, commands: list, output: str, on_done=None, outputs: list = None, stages: list = None, temp_files: list = None, files: dict = None, total_frames: int = None) -> None:
+        self.stages = stages or [[commands]]
+        self.files = files or {}
+        self.output = output
+        self.outputs = outputs or [output]
+        self.on_done = on_done
+        self.temp_files = temp_files or []
+        self.status = "queued" # queued, running, done, failed, cancelled
+        self.procs = []
+        self.started = None
+        self.finished = None
+        self.total_frames = total_frames
+        self.progress = {}
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"EncodeJob({Path(self.output).name}, {self.status})"
+
+    def run(self) -> bool:
+        """Run every stage and wait for it, returns True if all commands succeed"""
+        self.started = time.time()
+        try:
+            for path, text in self.files.items():
+                with open(path, "w") as f:
+                    f.write(text)
+        except OSError as e:
+            logger(f"Could not write ffmpeg job files\n{e}")
+            self.status = "failed"
+            [Path(x).unlink(missing_ok=True) for x in self.temp_files]
+            self.finished = time.time()
+            return False
+
+        for index, stage in enumerate(self.stages):
+            with self._lock:
+                if self.status == "cancelled":
+                    break
+                # Started segments are kept one by one, so a failed start kills only processes of this stage
+                self._frames = {}
+                self.procs = []
+                try:
+                    for commands in stage:
+                        self.procs.append(subprocess.Popen(commands[:1] + ["-progress", "pipe:1", "-nostats"] + commands[1:],
+                                                           stdout=subprocess.PIPE))
+                    self.status = "running"
+                except OSError as e:
+                    logger(f"Error occured during subprocces run ffmpeg command\n\nErrorLog:\n{e}")
+                    [p.kill() for p in self.procs]
+                    [p.wait() for p in self.procs]
+                    self.status = "failed"
+                    break
+
+            readers = [threading.Thread(target=self._read_progress, args=(index, i, p), daemon=True)
+                       for i, p in enumerate(self.procs)]
+            [x.start() for x in readers]
+            codes = [p.wait() for p in self.procs]
+            [x.join() for x in readers]
+
+            with self._lock:
+                if self.status == "cancelled":
+                    break
+                if any(codes):
+                    logger(f"ffmpeg exited with codes {codes}\n{self.output}")
+                    self.status = "failed"
+                    break
+        else:
+            self.status = "done"
+
+        if self.status == "cancelled":
+            [Path(x).unlink(missing_ok=True) for x in self.outputs]
+        [Path(x).unlink(missing_ok=True) for x in self.temp_files]
+        self.finished = time.time()
+        return self.status == "done"
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.status in ("queued", "running"):
+                self.status = "cancelled"
+                [p.terminate() for p in self.procs]
+
+    def _read_progress(self, stage: int, index: int, proc: subprocess.Popen) -> None:
+        """Parse "key=value" blocks of ffmpeg -progress, every block ends with "progress=continue|end" """
+        state = {}
+        for line in proc.stdout:
+            key, _, value = line.decode("utf-8", "ignore").strip().partition("=")
+            state[key] = value.strip()
+            if key != "progress":
+                continue
+
+            with self._lock:
+                try:
+                    fps = float(state.get("fps", 0))
+                    speed = float(state.get("speed", "0x").rstrip("x"))
+                except ValueError:
+                    fps, speed = 0.0, 0.0
+                self._frames[index] = (int(state.get("frame", 0) or 0), fps, speed)
+                # Segments run at the same time, so their frames and speeds add up
+                frame = sum(x[0] for x in self._frames.values())
+                fps = sum(x[1] for x in self._frames.values())
+                total = self.total_frames
+                self.progress = {
+                    "stage": stage,
+                    "frame": frame,
+                    "total": total,
+                    "fps": fps,
+                    "speed": sum(x[2] for x in self._frames.values()),
+                    "eta": (total - frame) / fps if total and fps and not stage else None,
+                    "percent": 100 if stage else min(frame / total * 100, 100) if total else None,
+                }
+            state = {}
+
+    @staticmethod
+    def describe(state: dict) -> str:
+        """Status line of job.progress"""
+        if state.get("stage", 0) > 0:
+            return "Joining segments"
+        if state:
+            eta = f"{state['eta']:.0f}s" if state.get("eta") is not None else "-"
+            total = f"/{state['total']}" if state.get("total") else ""
+            return f"Frame {state['frame']}{total}   {state['fps']:.1f} fps   {state['speed']:.2f}x   ETA {eta}"
+        return "Starting ffmpeg"
+
+class HouProgress:
+    """Houdini interrupt dialog to use as FFmpeg.convert_to_video progress callback
+
+    Pressing cancel in the dialog makes the callback return False, which stops ffmpeg.
+    """
+    def __init__(self, title: str = "Encoding video") -> None:
+        self.operation = hou.InterruptableOperation(title, long_op_name=title, open_interrupt_dialog=True)
+
+    def __enter__(self) -> "HouProgress":
+        self.operation.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        return self.operation.__exit__(*args)
+
+    def __call__(self, state: dict) -> bool:
+        status = EncodeJob.describe(state)
+        percent = state.get("percent")
+        try:
+            self.operation.updateLongProgress(percent / 100 if percent is not None else -1, status)
+        except hou.OperationInterrupted:
+            return False
+        return True
+
+class EncodeJobManager:
+    """Runs EncodeJobs one by one in a background thread, so Houdini stays responsive
+
+    Progress of the running job is shown in Houdini status bar every interval.
+
+    Args:
+        maxsize (int, optional): Max number of waiting jobs. Defaults to 4.
+        interval (float, optional): Seconds between status bar updates. Defaults to 0.5.
+    """
+    _instance = None
+
+    def __init__(self, maxsize: int = 4, interval: float = 0.5) -> None:
+        self.interval = interval
+        self.jobs = []
+        self._queue = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def instance(cls, maxsize: int = 4) -> "EncodeJobManager":
+        """Shared manager of the session, queue is resized to maxsize if it changed in settings"""
+        if cls._instance is None:
+            cls._instance = cls(maxsize)
+        with cls._instance._queue.mutex:
+            cls._instance._queue.maxsize = maxsize
+        return cls._instance
+
+    def submit(self, job: EncodeJob) -> bool:
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            logger(f"Encode queue is full ({self._queue.maxsize} jobs)\n{job.output}")
+            return False
+
+        with self._lock:
+            self.jobs = [x for x in self.jobs if x.status in ("queued", "running")] + [job]
+        return True
+
+    def cancel(self, job: EncodeJob = None) -> None:
+        """Cancel job, or every queued and running job if no job set"""
+        with self._lock:
+            jobs = [job] if job else list(self.jobs)
+        for j in jobs:
+            j.cancel()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job.status != "cancelled":
+                reporter = threading.Thread(target=self._report, args=(job,), daemon=True)
+                reporter.start()
+                job.run()
+                reporter.join()
+            self._done(job)
+
+    def _report(self, job: EncodeJob):
+        name = Path(job.output).name
+        while job.finished is None:
+            time.sleep(self.interval)
+            queued = self._queue.qsize()
+            waiting = f"   ({queued} queued)" if queued else ""
+            self._status(f"Encoding {name}: {job.describe(dict(job.progress))}{waiting}")
+        self._status(f"Encoded {name}" if job.status == "done" else f"Encoding {name} {job.status}")
+
+    @staticmethod
+    def _status(message: str):
+        """Status bar can only be set from the main thread"""
+        try:
+            import hdefereval
+            hdefereval.executeDeferred(hou.ui.setStatusMessage, message)
+        except ImportError:
+            pass
+
+    def _done(self, job: EncodeJob):
+        if not job.on_done:
+            return
+        try:
+            import hdefereval
+            hdefereval.executeDeferred(job.on_done, job)
+        except ImportError:
+            job.on_done(job)
+
+class FFmpegStream:
+    """Long-running ffmpeg process fed with frames through stdin (image2pipe)
+
+    Used as a FrameWatcher listener: frame N is pushed to ffmpeg
+    as soon as frame N+1 appears, so we never read a half-written file.
+    The last frame is pushed in finish(), after the flipbook is done.
+    """
+    def __init__(self, commands: list, output: str, outputs: list = None) -> None:
+        self.output = output
+        self.outputs = outputs or [output]
+        self._pending = None
+        self._queue = queue.Queue()
+        self.proc = subprocess.Popen(commands, stdin=subprocess.PIPE)
+        self._thread = threading.Thread(target=self._feed, daemon=True)
+        self._thread.start()
+
+    def __call__(self, frame: int, path: str, timestamp: float) -> None:
+        if self._pending:
+            self._queue.put(self._pending)
+        self._pending = path
+
+    def _feed(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            try:
+                with open(path, "rb") as f:
+                    self.proc.stdin.write(f.read())
+            except OSError as e:
+                logger(f"Streaming to ffmpeg stopped on:\n{path}\n\nErrorLog:\n{e}")
+                break
+
+    def finish(self) -> bool:
+        """Push the last frame, close stdin and wait for ffmpeg to write the video"""
+        if self._pending:
+            self._queue.put(self._pending)
+            self._pending = None
+        self._queue.put(None)
+        self._thread.join()
+
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+
+        if self.proc.wait() != 0:
+            logger(f"ffmpeg exited with code {self.proc.returncode} while streaming\n{self.output}")
+            return False
+        return True
+
+    def cancel(self) -> None:
+        """Kill ffmpeg and remove the partial video"""
+        self._pending = None
+        self._queue.put(None)
+        self.proc.kill()
+        self._thread.join()
+        self.proc.wait()
+        [Path(x).unlink(missing_ok=True) for x in self.outputs]
+
+class FrameManifest:
+    """Frames of one flipbook version, found with a single os.scandir pass over the version folder
+
+    Frame files are matched by the sequence name around the padding token, so stray files
+    in the folder are never counted as frames. Empty files are treated as missing.
+    `converted` is stored once the fully rendered sequence is encoded, such version can't be resumed.
+
+    Args:
+        sequence (str): Path with padding like "name.v001.$F4.exr"
+        padding (str): Padding token like "$F4"
+        frame_start (int): First expected frame
+        frame_end (int): Last expected frame
+    """
+    FILE = "manifest.json"
+
+    def __init__(self, sequence: str, padding: str, frame_start: int, frame_end: int) -> None:
+        self.sequence = Path(sequence)
+        self.padding = padding
+        self.frame_start = int(frame_start)
+        self.frame_end = int(frame_end)
+        prefix, _, suffix = self.sequence.name.partition(padding)
+        self._pattern = re.compile(re.escape(prefix) + r"(-?\d+)" + re.escape(suffix))
+        self.frames = {}
+        self.strays = []
+        self.held = {}
+        self.problems = {}
+        self.converted = False
+
+    @property
+    def folder(self) -> Path:
+        return self.sequence.parent
+
+    def scan(self) -> "FrameManifest":
+        """{frame: (path, size, mtime)} of written frames, everything else in folder goes to strays"""
+        self.frames = {}
+        self.strays = []
+        self.held = {}
+        self.converted = False
+        try:
+            entries = os.scandir(self.folder)
+        except OSError:
+            return self
+        with entries:
+            for entry in entries:
+                if entry.name == self.FILE or not entry.is_file():
+                    continue
+                match = self._pattern.fullmatch(entry.name)
+                frame = int(match[1]) if match else None
+                if frame is None or not self.frame_start <= frame <= self.frame_end:
+                    self.strays.append(Path(entry.path))
+                    continue
+                stat = entry.stat()
+                if stat.st_size:
+                    self.frames[frame] = (Path(entry.path), stat.st_size, stat.st_mtime)
+
+        # Frames held by fillGaps of previous run are still links, not rendered frames
+        data = self.read(self.folder) or {}
+        self.converted = bool(data.get("converted"))
+        try:
+            held = data.get("held", {})
+            self.held = {int(k): v for k, v in held.items() if int(k) in self.frames}
+        except (ValueError, AttributeError):
+            pass
+        return self
+
+    @classmethod
+    def read(cls, folder) -> dict:
+        """Stored manifest of version folder or None"""
+        try:
+            with open(Path(folder) / cls.FILE) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    def releaseHeld(self) -> None:
+        """Remove held frames, so they are missing again and can be rendered without touching linked frames"""
+        for frame in self.held:
+            self.frames.pop(frame)[0].unlink(missing_ok=True)
+        if self.held:
+            self.held = {}
+            self.write()
+
+    @staticmethod
+    def ranges(frames) -> list:
+        """Sorted frames grouped to [(start, end), ...] runs"""
+        result = []
+        for frame in sorted(frames):
+            if result and frame == result[-1][1] + 1:
+                result[-1] = (result[-1][0], frame)
+            else:
+                result.append((frame, frame))
+        return result
+
+    def missing(self) -> list:
+        return [x for x in range(self.frame_start, self.frame_end + 1) if x not in self.frames]
+
+    def missingRanges(self) -> list:
+        return self.ranges(self.missing())
+
+    def writtenRanges(self) -> list:
+        return self.ranges(self.frames)
+
+    def complete(self) -> bool:
+        return len(self.frames) == self.frame_end - self.frame_start + 1
+
+    def files(self, start: int = None, end: int = None) -> list:
+        """Paths of written frames, optionally only frames in start-end range"""
+        start = self.frame_start if start is None else start
+        end = self.frame_end if end is None else end
+        return [x[0] for frame, x in self.frames.items() if start <= frame <= end]
+
+    def bytes(self) -> int:
+        """Size of rendered frames, held frames are links and don't take space"""
+        return sum(x[1] for frame, x in self.frames.items() if frame not in self.held)
+
+    def rendered(self) -> int:
+        """Number of frames in bytes()"""
+        return len([x for x in self.frames if x not in self.held])
+
+    def fillGaps(self) -> dict:
+        """Fill missing frames with hardlinks to the nearest previous written frame
+
+        Frames before the first written one hold the first written frame.
+        Falls back to copy where hardlinks are not supported.
+
+        Returns:
+            dict: {held frame: source frame}
+        """
+        written = sorted(self.frames)
+        if not written:
+            return {}
+
+        held = {}
+        source = written[0]
+        for frame in range(self.frame_start, self.frame_end + 1):
+            if frame in self.frames:
+                source = frame
+                continue
+            path = Path(frame_path(self.sequence.as_posix(), self.padding, frame))
+            source_path = self.frames[source][0]
+            try:
+                path.unlink(missing_ok=True)
+                try:
+                    os.link(source_path, path)
+                except OSError:
+                    shutil.copy2(source_path, path)
+            except OSError as e:
+                logger(f"Could not hold frame {frame}\n{e}")
+                continue
+            held[frame] = source
+
+        for frame, source in held.items():
+            self.frames[frame] = (Path(frame_path(self.sequence.as_posix(), self.padding, frame)),) + self.frames[source][1:]
+        self.held.update(held)
+        return held
+
+    def describeMissing(self) -> str:
+        """Missing ranges like "1001-1010, 1050" """
+        return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in self.missingRanges())
+
+    def verify(self, workers: int = 0) -> dict:
+        """Problems of written frames found by FrameVerifier, held frames are skipped as they duplicate on purpose"""
+        frames = {frame: x[0] for frame, x in self.frames.items() if frame not in self.held}
+        self.problems = FrameVerifier(workers).verify(frames)
+        return self.problems
+
+    def describeProblems(self) -> str:
+        return "\n".join(f"{name}: {', '.join(f'{a}-{b}' if a != b else str(a) for a, b in self.ranges(frames))}"
+                         for name, frames in self.problems.items())
+
+    def write(self) -> None:
+        """Store manifest next to the sequence"""
+        data = {
+            "sequence": self.sequence.name,
+            "frame_start": self.frame_start,
+            "frame_end": self.frame_end,
+            "written": {str(frame): {"file": path.name, "size": size, "mtime": mtime}
+                        for frame, (path, size, mtime) in sorted(self.frames.items())},
+            "missing": self.missingRanges(),
+            "held": {str(frame): source for frame, source in sorted(self.held.items())},
+            "problems": self.problems,
+            "strays": [x.name for x in self.strays],
+            "converted": self.converted,
+        }
+        try:
+            with open(self.folder / self.FILE, "w") as f:
+                json.dump(data, f, indent=4)
+        except OSError as e:
+            logger(f"Could not write frame manifest\n{e}")
+
+class FrameWatcher(threading.Thread):
+    """Watch for frames of a padded sequence while the flipbook is writing it
+
+    Listeners are called as `listener(frame, path, timestamp)` in frame order
+    when the frame file appears on disk.
+    """
+    def __init__(self, sequence: str, padding: str, frame_start: int, frame_end: int, interval: float = 0.05) -> None:
+        super().__init__(daemon=True)
+        self.sequence = sequence
+        self.padding = padding
+        self.frame_start = int(frame_start)
+        self.frame_end = int(frame_end)
+        self.interval = interval
+        self.listeners = []
+        self._done = threading.Event()
+
+    def run(self):
+        frame = self.frame_start
+        while frame <= self.frame_end:
+            path = frame_path(self.sequence, self.padding, frame)
+            if Path(path).exists():
+                timestamp = time.time()
+                for listener in self.listeners:
+                    listener(frame, path, timestamp)
+                frame += 1
+            elif self._done.is_set():
+                # Flipbook is over, this frame will never appear
+                frame += 1
+            else:
+                time.sleep(self.interval)
+
+    def stop(self) -> None:
+        """Call after the flipbook is finished, waits for the last frames to be dispatched"""
+        self._done.set()
+        self.join()
+
+class RenderMonitor:
+    """FrameWatcher listener timing every frame of the flipbook
+
+    Draw and write time of a frame is the gap between its file mtime and the previous frame's,
+    the first frame is counted from monitor creation. Frames already on disk before the flipbook
+    started (resume) are skipped. Stats go next to the sequence as render_stats.json.
+
+    Args:
+        folder (Path): Version folder
+        window (int): Frames in rolling fps
+        slowest (int): Number of slowest frames to report
+    """
+    FILE = "render_stats.json"
+
+    def __init__(self, folder: Path, window: int = 10, slowest: int = 10) -> None:
+        self.folder = Path(folder)
+        self.window = window
+        self.slowest = slowest
+        self.start = time.time()
+        self.frames = []
+        self._last = self.start
+
+    def __call__(self, frame: int, path: str, timestamp: float) -> None:
+        try:
+            written = os.stat(path).st_mtime
+        except OSError:
+            written = timestamp
+        if written < self.start:
+            return
+        self.frames.append((frame, max(written - self._last, 0.0)))
+        self._last = max(written, self._last)
+
+    def stats(self) -> dict:
+        seconds = [x[1] for x in self.frames]
+        total = sum(seconds)
+        frames = []
+        for i, (frame, duration) in enumerate(self.frames):
+            window = seconds[max(0, i - self.window + 1):i + 1]
+            frames.append({"frame": frame, "seconds": round(duration, 4),
+                           "rolling_fps": round(len(window) / sum(window), 2) if sum(window) else None})
+        return {
+            "frames_count": len(self.frames),
+            "seconds": round(total, 3),
+            "fps": round(len(self.frames) / total, 2) if total else None,
+            "slowest": [{"frame": frame, "seconds": round(duration, 4)}
+                        for frame, duration in sorted(self.frames, key=lambda x: -x[1])[:self.slowest]],
+            "frames": frames,
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        slowest = ", ".join(f"{x['frame']} ({x['seconds']:.2f}s)" for x in stats["slowest"][:5])
+        return f"Flipbook rendered {stats['frames_count']} frames in {stats['seconds']:.1f}s, {stats['fps']} fps\nSlowest frames: {slowest}"
+
+    def write(self) -> None:
+        try:
+            with open(self.folder / self.FILE, "w") as f:
+                json.dump(self.stats(), f, indent=4)
+        except OSError as e:
+            logger(f"Could not write render stats\n{e}")
 
 class HouViewport:
+    _render_settings = {}
+
     def __init__(self,kwargs) -> None:
         self.viewport_panetab = hou.ui.paneTabOfType(hou.paneTabType.SceneViewer)
 
@@ -201,26 +1178,78 @@ class HouViewport:
     def displayBackgroundImage(self,type=True):
         self.settings.setDisplayBackgroundImage(type)
 
+    def renderSettings(self):
+        """Resolution and pixel aspect of RenderSettings prim on the viewer LOP stage
+
+        Lookup goes from cheap to expensive: stage "renderSettingsPrimPath" metadata,
+        the standard /Render scope, then a traversal which descends only into scopes and untyped prims,
+        RenderSettings never live under imageable prims like xforms, geometry or instances, or under materials. Result is cached per stage and per cook of the display node.
+
+        Returns:
+            tuple: ((resx, resy), aspect) or None if no RenderSettings prim found
+        """
+        from pxr import Usd, UsdGeom, UsdShade
+
+        stage = self.viewport_panetab.stage()
+        if not stage:
+            return None
+
+        node = self.viewport_panetab.pwd().displayNode()
+        key = None
+        if node:
+            key = (stage.GetRootLayer().identifier, node.sessionId(), node.cookCount())
+            if key in self._render_settings:
+                return self._render_settings[key]
+
+        prims = []
+        path = stage.GetMetadata("renderSettingsPrimPath")
+        if path:
+            prim = stage.GetPrimAtPath(path)
+            if prim and prim.GetTypeName()=="RenderSettings":
+                prims = [prim]
+
+        if not prims:
+            scope = stage.GetPrimAtPath("/Render")
+            if scope:
+                prims = [p for p in Usd.PrimRange(scope) if p.GetTypeName()=="RenderSettings"]
+
+        if not prims:
+            iterator = iter(Usd.PrimRange(stage.GetPseudoRoot()))
+            for prim in iterator:
+                if prim.GetTypeName()=="RenderSettings":
+                    prims.append(prim)
+                elif prim.IsInstance() or prim.IsA(UsdShade.NodeGraph) or \
+                        (prim.IsA(UsdGeom.Imageable) and not prim.IsA(UsdGeom.Scope)):
+                    iterator.PruneChildren()
+
+        if len(prims)==0:
+            result = None
+        else:
+            if len(prims)>1:
+                logger("Multiple rendersettings prims detected!\nResolution will be taken from the first alphabetically ordered prim")
+            render_prim = sorted(prims, key=lambda p: p.GetPath())[0]
+            resolution = render_prim.GetAttribute("resolution").Get()
+            aspect = render_prim.GetAttribute("pixelAspectRatio").Get()
+            result = ((resolution[0], resolution[1]), aspect if aspect else 1)
+
+        if key:
+            self._render_settings.clear()
+            self._render_settings[key] = result
+        return result
+
     def cameraResolution(self):
         network = self.viewport_panetab.pwd().childTypeCategory().name()
         viewport = self.viewport_panetab.curViewport()
 
         if network=="Lop":
 
-            stage = self.viewport_panetab.stage()
-            render_prims = [p for p in stage.Traverse() if p.GetTypeName()=="RenderSettings"]
-            if len(render_prims)==0:
+            render_settings = self.renderSettings()
+            if not render_settings:
                 size = viewport.size()
                 resx = size[2]
                 resy = size[3]
-                
-            elif len(render_prims)>0:
-                if len(render_prims)>1:
-                    logger("Multiple rendersettings prims detected!\nResolution will be taken from the first alphabetically ordered prim")
-                render_prim = render_prims[0]
-                resolution = render_prim.GetProperty("resolution").Get()
-                resx = resolution[0]
-                resy = resolution[1]
+            else:
+                resx, resy = render_settings[0]
         
         else: #proccess obj and sops
             
@@ -243,13 +1272,11 @@ class HouViewport:
 
         if network=="Lop":
 
-            stage = self.viewport_panetab.stage()
-            render_prims = [p for p in stage.Traverse() if p.GetTypeName()=="RenderSettings"]
-            if len(render_prims)==0:
+            render_settings = self.renderSettings()
+            if not render_settings:
                 aspect = 1
-            elif len(render_prims)>0:
-                render_prim = render_prims[0]
-                aspect = render_prim.GetProperty("pixelAspectRatio").Get()
+            else:
+                aspect = render_settings[1]
         
         else: #procces obj and sops
 
@@ -274,51 +1301,394 @@ class HouViewport:
     def flipbook_settings(self):
         return self.viewport_panetab.flipbookSettings().stash()
 
+class FsWorker(QObject):
+    """Runs filesystem probes in QThreadPool and returns results to the main thread
+
+    Result of every probe comes back through `done` signal as (name, result).
+    Only the latest request of each name is delivered, older results are dropped.
+    """
+    done = Signal(str, object)
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._serial = {}
+
+    def submit(self, name: str, func, *args) -> None:
+        serial = self._serial.get(name, 0) + 1
+        self._serial[name] = serial
+        QThreadPool.globalInstance().start(_FsProbe(self, name, serial, func, args))
+
+    def _deliver(self, name: str, serial: int, result) -> None:
+        if self._serial.get(name) == serial:
+            self.done.emit(name, result)
+
+class _FsProbeSignals(QObject):
+    result = Signal(str, int, object)
+
+class _FsProbe(QRunnable):
+    def __init__(self, worker: FsWorker, name: str, serial: int, func, args: tuple) -> None:
+        super().__init__()
+        self.name = name
+        self.serial = serial
+        self.func = func
+        self.args = args
+        # Signals object lives in the main thread, so emitting from pool thread is queued to it
+        self.signals = _FsProbeSignals()
+        self.signals.result.connect(worker._deliver)
+
+    def run(self):
+        try:
+            result = self.func(*self.args)
+        except OSError as e:
+            logger(f"Filesystem probe '{self.name}' failed\n{e}")
+            result = None
+        self.signals.result.emit(self.name, self.serial, result)
+
+class FlipbookEstimator:
+    """RAM and disk size of flipbook depending on file format
+
+    MPlay keeps every frame in memory, 8 bit RGBA for jpg/png and half float RGBA for exr.
+    Disk size per pixel starts from rough defaults and is replaced by real sizes
+    of previous flipbooks from FlipbookCatalog (see calibrate).
+    """
+    RAM_BYTES_PER_PIXEL = {"exr": 8, "png": 4, "jpg": 4}
+    DISK_BYTES_PER_PIXEL = {"exr": 4.0, "png": 2.5, "jpg": 0.4}
+
+    def __init__(self) -> None:
+        self.calibration = {}
+
+    def calibrate(self, catalog: str, root: str) -> dict:
+        """Bytes per pixel by format from catalog of preview folder. Safe to run in FsWorker"""
+        try:
+            return FlipbookCatalog(catalog).bytesPerPixel(Path(root).resolve().as_posix())
+        except sqlite3.Error as e:
+            logger(f"Flipbook catalog is not available\n{e}")
+            return {}
+
+    def estimate(self, resolution: tuple, frames: int, fileformat: str, aspect: float = 1, mplay: bool = True) -> tuple:
+        """
+        Args:
+            resolution (tuple): Flipbook resolution
+            frames (int): Number of frames
+            fileformat (str): exr, jpg or png
+            aspect (float, optional): Pixel aspect to apply to width. Defaults to 1.
+            mplay (bool, optional): Frames are loaded to MPlay. Defaults to True.
+
+        Returns:
+            tuple: (RAM bytes, disk bytes)
+        """
+        pixels = int(resolution[0] * aspect) * int(resolution[1])
+        ram_per_frame = pixels * self.RAM_BYTES_PER_PIXEL.get(fileformat, 4)
+        # Without MPlay only the frame being written is in memory
+        ram = ram_per_frame * (max(frames, 1) if mplay else 1)
+        disk_per_pixel = self.calibration.get(fileformat, self.DISK_BYTES_PER_PIXEL.get(fileformat, 4.0))
+        disk = pixels * disk_per_pixel * max(frames, 1)
+        return ram, disk
+
+class Preflight:
+    """Admission control of flipbook before it starts
+
+    Estimated RAM and disk size are compared with available memory and free space
+    on the target filesystem. Thresholds are percents of what is available, from "advanced" settings:
+    over *_warn_pct asks user to continue, over *_block_pct stops the flipbook.
+    RAM over block threshold turns MPlay loading off instead when "preflight_mplay_auto_off" is set,
+    frames are still written to disk.
+    """
+    OK = "ok"
+    WARN = "warn"
+    NO_MPLAY = "no_mplay"
+    BLOCK = "block"
+
+    def __init__(self, advanced: dict, estimator: FlipbookEstimator = None) -> None:
+        self.advanced = advanced
+        self.estimator = estimator or FlipbookEstimator()
+
+    @staticmethod
+    def availableMemory() -> int:
+        """Available physical memory in bytes, None if it can't be found"""
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+
+        if os.name == "nt":
+            import ctypes
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                            ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                            ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                            ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                            ("sullAvailExtendedVirtual", ctypes.c_ulonglong)]
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullAvailPhys
+            return None
+
+        try:
+            return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            return None
+
+    @staticmethod
+    def freeSpace(folder: Path) -> int:
+        """Free bytes on filesystem of folder or its nearest existing parent, None if it can't be found"""
+        folder = Path(folder)
+        while not folder.exists() and folder.parent != folder:
+            folder = folder.parent
+        try:
+            return shutil.disk_usage(folder).free
+        except OSError:
+            return None
+
+    def check(self, folder: Path, resolution: tuple, frames: int, fileformat: str, aspect: float = 1, mplay: bool = True) -> tuple:
+        """
+        Returns:
+            tuple: (decision, message), decision is one of OK, WARN, NO_MPLAY, BLOCK
+        """
+        if not self.advanced["preflight"]:
+            return self.OK, ""
+
+        ram, disk = self.estimator.estimate(resolution, frames, fileformat, aspect=aspect, mplay=mplay)
+        available = self.availableMemory()
+        free = self.freeSpace(folder)
+        gb = 1024**3
+
+        def percent(need, have):
+            return need / have * 100 if have else 0
+
+        disk_pct = percent(disk, free)
+        if disk_pct > self.advanced["preflight_disk_block_pct"]:
+            return self.BLOCK, f"Flipbook needs ~{disk/gb:.2f} GB, only {free/gb:.2f} GB free in\n{Path(folder).as_posix()}"
+
+        ram_pct = percent(ram, available) if mplay else 0
+        if ram_pct > self.advanced["preflight_ram_block_pct"]:
+            message = f"MPlay needs ~{ram/gb:.2f} GB of RAM, only {available/gb:.2f} GB available"
+            if self.advanced["preflight_mplay_auto_off"]:
+                return self.NO_MPLAY, message + "\nFrames will be written without loading to MPlay"
+            return self.BLOCK, message
+
+        warnings = []
+        if ram_pct > self.advanced["preflight_ram_warn_pct"]:
+            warnings.append(f"MPlay needs ~{ram/gb:.2f} GB of RAM, {available/gb:.2f} GB available")
+        if disk_pct > self.advanced["preflight_disk_warn_pct"]:
+            warnings.append(f"Flipbook needs ~{disk/gb:.2f} GB, {free/gb:.2f} GB free")
+        if warnings:
+            return self.WARN, "\n".join(warnings)
+        return self.OK, ""
+
+class VersionIndex:
+    """Numerically ordered "vNNN" folders of flipbooks
+
+    Listings are cached per folder and refreshed only when the folder mtime changes.
+    Cache is shared by every instance, so UI and flipbook.start don't scan the same folder twice.
+    """
+    _cache = {}
+    _pattern = re.compile(r"^v(\d+)$")
+
+    def versions(self, folder) -> list:
+        """Version names sorted by number, "v999" goes before "v1000" """
+        folder = Path(folder)
+        try:
+            mtime = folder.stat().st_mtime_ns
+        except OSError:
+            return []
+
+        key = folder.as_posix()
+        cached = self._cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        versions = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                match = self._pattern.match(entry.name)
+                if match and entry.is_dir():
+                    versions.append((int(match[1]), entry.name))
+        versions = [name for _, name in sorted(versions)]
+
+        self._cache[key] = (mtime, versions)
+        return versions
+
+    def last(self, folder) -> str:
+        """Last version name or None"""
+        versions = self.versions(folder)
+        return versions[-1] if versions else None
+
+    def next(self, folder) -> str:
+        """Version name after the last one, keeps padding of the last version"""
+        last = self.last(folder) or "v000"
+        return f"v{str(int(last[1:])+1).zfill(len(last)-1)}"
+
+    def reserve(self, folder, retries: int = 20, backoff: float = 0.05) -> str:
+        """Atomically take next version by creating its folder
+
+        Exclusive mkdir fails if another session or batch job took the same version first,
+        in that case listing is refreshed and the next number is tried after a random backoff.
+
+        Returns:
+            str: Reserved version name or None if all retries failed
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        for attempt in range(max(int(retries), 1)):
+            version = self.next(folder)
+            try:
+                (folder / version).mkdir()
+            except FileExistsError:
+                self.invalidate(folder)
+                time.sleep(backoff * 2**min(attempt, 5) * random.uniform(0.5, 1.5))
+                continue
+            self.invalidate(folder)
+            return version
+
+        logger(f"Could not reserve new version in\n{folder.as_posix()}\nafter {retries} attempts")
+        return None
+
+    def invalidate(self, folder=None) -> None:
+        if folder is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(Path(folder).as_posix(), None)
+
 class FileParser:
     def __init__(self) -> None:
-        settings_file = (Path(__file__).parents[1] / "settings.json").as_posix()
-        data = {}
-        with open(settings_file) as f:
-            data = json.load(f)
-        self.paths = data.get("paths")
+        self.settings = Settings()
+        self.versions = VersionIndex()
+
+    @property
+    def paths(self) -> dict:
+        return self.settings.paths
+
+    def getFolder(self,flipbook_name:str) -> str:
+        """Expanded flipbook folder path, doesn't touch the disk"""
+        return hou.text.expandString(self.paths.get("fb_folder")).format(name=flipbook_name)
 
     def getVersion(self,flipbook_name:str) -> str:
-        fb_folder = Path(hou.text.expandString(self.paths.get("fb_folder")).format(name=flipbook_name)).resolve()
-        if fb_folder.exists() and len(flipbook_name)!=0:
-            write_folder_vers = [x.name for x in fb_folder.iterdir() if x.is_dir()]
-            write_folder_vers = write_folder_vers if len(write_folder_vers) > 0 else ['v000']
-            last_ver_str = sorted(write_folder_vers)[-1][1:]
-            ver_digit = int(last_ver_str)+1
-            ver_padding = len(last_ver_str)
-            ver_str = f"v{str(ver_digit).zfill(ver_padding)}"
-        else:
-            ver_str = "v001"
-        return ver_str
+        if len(flipbook_name)==0:
+            return "v001"
+        return self.nextVersion(self.getFolder(flipbook_name))
+
+    def nextVersion(self,fb_folder:str) -> str:
+        """Filesystem part of getVersion, safe to run in FsWorker"""
+        return self.versions.next(Path(fb_folder).resolve())
+
+    def catalogPath(self) -> str:
+        """Expanded path of FlipbookCatalog database, doesn't touch the disk"""
+        return (Path(hou.text.expandString(self.paths.get("tmp_folder"))) / self.paths.get("catalog","catalog.sqlite")).as_posix()
+
+    def catalog(self) -> FlipbookCatalog:
+        return FlipbookCatalog(self.catalogPath())
+
+    def thumbnailsPath(self) -> str:
+        """Expanded path of ThumbnailCache folder, doesn't touch the disk"""
+        return (Path(hou.text.expandString(self.paths.get("tmp_folder"))) / self.paths.get("thumbnails","thumbnails")).as_posix()
+
+    def tracePath(self) -> str:
+        """Expanded path of Tracer JSONL file, doesn't touch the disk"""
+        return (Path(hou.text.expandString(self.paths.get("tmp_folder"))) / self.paths.get("trace","trace.jsonl")).as_posix()
+
+    def tracer(self, name: str = "flipbook") -> Tracer:
+        """Tracer recording spans if trace file or performance history is on"""
+        advanced = self.settings.advanced
+        return Tracer(name, enabled=advanced["trace"] or advanced["history"])
+
+    def historyPath(self) -> str:
+        """Expanded path of PerformanceHistory file, doesn't touch the disk"""
+        return (Path(hou.text.expandString(self.paths.get("tmp_folder"))) / self.paths.get("history","history.jsonl")).as_posix()
+
+    def history(self) -> PerformanceHistory:
+        return PerformanceHistory(self.historyPath())
+
+    def thumbnails(self) -> ThumbnailCache:
+        return ThumbnailCache(self.thumbnailsPath(), self.settings.advanced["thumbnail_cache_mb"]*1024*1024)
+
+    def listThumbnails(self,pfolder:str,catalog:str,thumbnails:str) -> dict:
+        """
+        {name: (thumbnail path, contact sheet path)} of cached images of flipbooks in preview folder
+        Only already made images are returned, nothing is decoded. Safe to run in FsWorker
+        """
+        cache = ThumbnailCache(thumbnails)
+        try:
+            images = FlipbookCatalog(catalog).images(Path(pfolder).resolve().as_posix())
+        except sqlite3.Error as e:
+            logger(f"Flipbook catalog is not available\n{e}")
+            return {}
+        return {name: (cache.get(thumbnail), cache.get(sheet, "sheet")) for name, (thumbnail, sheet) in images.items()}
+
+    def listFlipbooks(self,pfolder:str,catalog:str,search:str=""):
+        """
+        Names of flipbooks in preview folder from FlipbookCatalog, most recent first,
+        or None if preview folder doesn't exist. Safe to run in FsWorker
+        """
+        pfolder = Path(pfolder).resolve()
+        if not pfolder.exists():
+            return None
+
+        catalog = FlipbookCatalog(catalog)
+        try:
+            catalog.sync(pfolder.as_posix())
+            return catalog.names(pfolder.as_posix(), search)
+        except sqlite3.Error as e:
+            logger(f"Flipbook catalog is not available\n{e}")
+            return [x.name for x in pfolder.iterdir() if x.is_dir()]
 
 class Icons:
+    """Icons from 'icons' folder
+
+    Folder listing, QIcons and rasterized pixmaps are cached for the whole process,
+    so after the first window building icons don't touch the disk or render SVG again.
+    """
+    _listing = None
+    _icons = {}
+    _pixmaps = {}
+
     def __init__(self) -> None:
         self.iconfolder = Path(__file__).parents[1] / "icons"
 
+    def listing(self) -> dict:
+        """{file name: posix path} of icons folder, listed once"""
+        if Icons._listing is None:
+            Icons._listing = {x.name: x.as_posix() for x in self.iconfolder.iterdir() if x.is_file()}
+        return Icons._listing
+
+    def icon(self, path: str) -> QIcon:
+        if path not in self._icons:
+            self._icons[path] = QIcon(path)
+        return self._icons[path]
+
+    def pixmap(self, name: str, size: int) -> QPixmap:
+        """Icon rasterized at size, name could be icon file name or full path"""
+        path = self.listing().get(name, name)
+        key = (path, size)
+        if key not in self._pixmaps:
+            pixmap = QPixmap(path)
+            self._pixmaps[key] = pixmap.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        return self._pixmaps[key]
+
     def get(self,name:str,type:str="Icon") -> QIcon:
-        iconpath = Path(self.iconfolder) / name
-        if not iconpath.exists():
-            logger(f"No icon found:\n{iconpath.as_posix()}")
+        iconpath = self.listing().get(name)
+        if not iconpath:
+            logger(f"No icon found:\n{(self.iconfolder / name).as_posix()}")
         else:
             if type=="Icon":
-                return QIcon(iconpath.as_posix())
+                return self.icon(iconpath)
             elif type=="Path":
-                return iconpath.as_posix()
+                return iconpath
 
     def getRandom(self,prefix="app",type="Icon"):
-        iconpath = Path(self.iconfolder)
-        icons = [x for x in iconpath.iterdir() if x.stem.startswith(prefix)]
+        icons = [path for name, path in self.listing().items() if name.startswith(prefix)]
         
         if len(icons)==0:
             logger(f"No files found with current prefix: {prefix}")
             return QIcon()
         else:
-            icon = (random.choice(icons)).as_posix()
+            icon = random.choice(icons)
             if type=="Icon":
-                return QIcon(icon)
+                return self.icon(icon)
             elif type=="Path":
-                return icon
\ No newline at end of file
+                return icon
@@ -0,0 +1,108 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+class FrameVerifier:
+    """Check written frames before they are encoded
+
+    Every frame is checked in a thread pool for non-zero size and a valid image header,
+    then decoded by ffmpeg to a tiny gray image. Luminance statistics of all frames
+    are computed at once with NumPy to flag black, blank (flat) and duplicate frames.
+    NumPy is optional, without it only size and header are checked.
+
+    Args:
+        workers (int): Threads, 0 for all cores
+        size (int): Side of downsampled gray image
+    """
+    HEADERS = {
+        ".exr": (b"\x76\x2f\x31\x01",),
+        ".png": (b"\x89PNG\r\n\x1a\n",),
+        ".jpg": (b"\xff\xd8\xff",),
+        ".jpeg": (b"\xff\xd8\xff",),
+    }
+    # Thresholds on 0-255 luminance
+    BLACK_MEAN = 2.0
+    BLANK_STD = 0.5
+    DUPLICATE_DIFF = 0.05
+
+    def __init__(self, workers: int = 0, size: int = 32) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.size = size
+
+    def header(self, path: Path) -> bool:
+        headers = self.HEADERS.get(path.suffix.lower())
+        if not headers:
+            return True
+        with open(path, "rb") as f:
+            head = f.read(max(len(x) for x in headers))
+        return any(head.startswith(x) for x in headers)
+
+    def luma(self, path: Path) -> bytes:
+        """Downsampled 8 bit luminance of frame or None if ffmpeg can't decode it"""
+        commands = ["ffmpeg", "-loglevel", "error", "-i", path.as_posix(),
+                    "-vf", f"scale={self.size}:{self.size},format=gray",
+                    "-frames:v", "1", "-f", "rawvideo", "pipe:1"]
+        if path.suffix == ".exr":
+            commands[3:3] = ["-apply_trc", "iec61966_2_1"]
+        result = subprocess.run(commands, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if result.returncode != 0 or len(result.stdout) != self.size * self.size:
+            return None
+        return result.stdout
+
+    def check(self, path: Path, decode: bool) -> tuple:
+        """(problem or None, luminance or None) of one frame"""
+        try:
+            if path.stat().st_size == 0:
+                return "empty", None
+            if not self.header(path):
+                return "invalid", None
+        except OSError:
+            return "missing", None
+        if not decode:
+            return None, None
+        luma = self.luma(path)
+        return (None, luma) if luma is not None else ("invalid", None)
+
+    def verify(self, frames: dict) -> dict:
+        """
+        Args:
+            frames (dict): {frame: path}
+
+        Returns:
+            dict: {"empty"|"invalid"|"missing"|"black"|"blank"|"duplicate": [frames]}, only found problems
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        decode = np is not None and shutil.which("ffmpeg") is not None
+
+        order = sorted(frames)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda x: self.check(Path(frames[x]), decode), order))
+
+        report = {}
+        for frame, (problem, _) in zip(order, results):
+            if problem:
+                report.setdefault(problem, []).append(frame)
+
+        decoded = [(frame, luma) for frame, (_, luma) in zip(order, results) if luma is not None]
+        if not decoded:
+            return report
+
+        luma = np.frombuffer(b"".join(x[1] for x in decoded), dtype=np.uint8)
+        luma = luma.reshape(len(decoded), -1).astype(np.float32)
+        numbers = np.array([x[0] for x in decoded])
+
+        black = luma.mean(axis=1) < self.BLACK_MEAN
+        blank = (luma.std(axis=1) < self.BLANK_STD) & ~black
+        # Compared with previous decoded frame, only if frames are neighbours
+        diff = np.abs(luma[1:] - luma[:-1]).mean(axis=1)
+        duplicate = (diff < self.DUPLICATE_DIFF) & (numbers[1:] - numbers[:-1] == 1)
+
+        for name, mask, found in (("black", black, numbers), ("blank", blank, numbers), ("duplicate", duplicate, numbers[1:])):
+            if mask.any():
+                report[name] = found[mask].tolist()
+        return report
@@ -2,10 +2,8 @@ from PySide2.QtWidgets import *
 from PySide2.QtGui import *
 from PySide2.QtCore import *
 from pathlib import Path
-from importlib import reload
 
 from . import utils
-reload(utils)
 
 styles = utils.StyleSheet((Path(__file__).parent / "stylesheets.json").as_posix())
 Icons = utils.Icons()
@@ -15,13 +13,29 @@ MAIN_FONT =   styles.get("main").get('font')
 MAIN_SIZE =   max(styles.get("main").get('fontsize'),3)
 TEXT_WEIGHT = {"normal": QFont.Medium,"bold": QFont.Bold}
 
-if MAIN_FONT=="_custom_":
-    id = QFontDatabase.addApplicationFont((Path(__file__).parents[1] / "misc" / "font.ttf").as_posix())
-    if id < 0:
-        utils.logger("No font found in 'misc/font.ttf'")
-        MAIN_FONT = "Arial"
-    else:
-        MAIN_FONT = QFontDatabase.applicationFontFamilies(id)[0]
+def fontFamily(font:str) -> str:
+    """
+    Resolve "_custom_" font to family of 'misc/font.ttf'
+    Font is registered on first widget that needs it, not on import,
+    and only once per process: family is kept on QApplication, so module reloads don't register it again
+    """
+    if font!="_custom_":
+        return font
+
+    app = QApplication.instance()
+    family = app.property("dinowrite_font")
+    if not family:
+        id = QFontDatabase.addApplicationFont((Path(__file__).parents[1] / "misc" / "font.ttf").as_posix())
+        if id < 0:
+            utils.logger("No font found in 'misc/font.ttf'")
+            family = "Arial"
+        else:
+            family = QFontDatabase.applicationFontFamilies(id)[0]
+        app.setProperty("dinowrite_font", family)
+    return family
+
+def Font(font:str,size:int,weight:int=-1) -> QFont:
+    return QFont(fontFamily(font),size,weight=weight)
 
 def Completer(array:list) -> QCompleter: 
     completer = QCompleter(array)
@@ -59,7 +73,7 @@ class Label(QLabel):
         
         super().__init__(parent)
         self.setText(label)
-        self.setFont(QFont(font,size,weight=TEXT_WEIGHT[weight]))
+        self.setFont(Font(font,size,weight=TEXT_WEIGHT[weight]))
         self.setStyleSheet(styles.get("label"))
 
 class HBLabel(Label):
@@ -122,7 +136,7 @@ class LineEdit(QLineEdit):
         
         super().__init__(parent)
         self.setText(spawntext)
-        self.setFont(QFont(font,size,))
+        self.setFont(Font(font,size))
         self.setStyleSheet(styles.get("lineedit"))
 
         if hint:
@@ -132,9 +146,9 @@ class LineEdit(QLineEdit):
 
     def makeBold(self,spawntext,font,size):
         if spawntext!=self.text():
-            self.setFont(QFont(font,size-1,weight=TEXT_WEIGHT["bold"]))
+            self.setFont(Font(font,size-1,weight=TEXT_WEIGHT["bold"]))
         else:
-            self.setFont(QFont(font,size,weight=TEXT_WEIGHT["normal"]))
+            self.setFont(Font(font,size,weight=TEXT_WEIGHT["normal"]))
 
 class DropDownButton(QPushButton):
     """
@@ -151,7 +165,7 @@ class DropDownButton(QPushButton):
         super().__init__(parent)
 
         self.setText(title if not icon else "")
-        self.setFont(QFont(font,size))
+        self.setFont(Font(font,size))
         self.setStyleSheet(styles.get("button"))
         self.setFocusPolicy(Qt.ClickFocus)
         buttonsize = 25
@@ -161,15 +175,24 @@ class DropDownButton(QPushButton):
         self.setChecked(False)
 
         if icon:
-            self.setIcon(QIcon((Path(__file__).parent / "icons" / icon).as_posix()))
+            self.setIcon(Icons.get(icon))
 
         self.menu = QMenu()
-        self.menu.setFont(QFont(font,size))
+        self.menu.setFont(Font(font,size))
         self.menu.setStyleSheet(styles.get("menu"))
         self.menu.setLayoutDirection(Qt.RightToLeft)
         self.menu.setCursor(Qt.PointingHandCursor)
         self.setMenu(self.menu)
 
+        self.setActions(menu,callback)
+
+    def setActions(self,menu:list,callback=None):
+        """
+        (Re)fill menu with actions
+        """
+        self.menu.clear()
+
+        menu = list(menu)
         if len(menu)==0:
             menu.append("No folders found")
 
@@ -177,10 +200,7 @@ class DropDownButton(QPushButton):
             if action_name=="---":
                 self.menu.addSeparator()
             elif action_name=="1/2": # bad coding :) but i'm lazy
-                pixmap = Icons.get("dino_knife_cut.svg",type="Path")
-                iconpixmap = QPixmap(pixmap)
-                iconpixmap = iconpixmap.scaled(25, 25, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                icon = QIcon(iconpixmap)
+                icon = QIcon(Icons.pixmap("dino_knife_cut.svg",25))
 
                 action = QAction(icon,action_name,self)
 
@@ -200,6 +220,19 @@ class DropDownButton(QPushButton):
                 
                 self.menu.addAction(action)
 
+    def setImages(self,images:dict):
+        """
+        Show cached images on actions: {action name: (thumbnail path, contact sheet path)}
+        Thumbnail is used as action icon and both are shown in tooltip
+        """
+        self.menu.setToolTipsVisible(True)
+        for action in self.menu.actions():
+            thumbnail, contact_sheet = images.get(action.text(),(None,None))
+            if thumbnail:
+                action.setIcon(QIcon(thumbnail))
+            tooltip = "".join(f"<img src='{x}'><br>" for x in (thumbnail,contact_sheet) if x)
+            action.setToolTip(tooltip or action.text())
+
 class CheckBox(QCheckBox):
     """
     Simple CheckBox
@@ -214,7 +247,7 @@ class CheckBox(QCheckBox):
         super().__init__(parent)
         
         self.setText(label)
-        self.setFont(QFont(font,size))
+        self.setFont(Font(font,size))
         self.setStyleSheet(styles.get("checkbox"))
         self.setChecked(default)
         self.setFocusPolicy(Qt.ClickFocus)
@@ -224,9 +257,9 @@ class CheckBox(QCheckBox):
 
     def makeBold(self,state,font,size):
         if state!=self.isChecked():
-            self.setFont(QFont(font,size,weight=TEXT_WEIGHT["bold"]))
+            self.setFont(Font(font,size,weight=TEXT_WEIGHT["bold"]))
         else:
-            self.setFont(QFont(font,size,weight=TEXT_WEIGHT["normal"]))
+            self.setFont(Font(font,size,weight=TEXT_WEIGHT["normal"]))
 
 class ComboBox(QComboBox):
     """
@@ -241,7 +274,7 @@ class ComboBox(QComboBox):
         
         super().__init__(parent)
 
-        self.setFont(QFont(font,size))
+        self.setFont(Font(font,size))
         self.setStyleSheet(styles.get("combobox"))
         self.setFocusPolicy(Qt.ClickFocus)
         self.insertItems(0,items)
@@ -254,9 +287,9 @@ class ComboBox(QComboBox):
 
     def makeBold(self,state,font,size):
         if state!=self.currentIndex():
-            self.setFont(QFont(font,size,weight=TEXT_WEIGHT["bold"]))
+            self.setFont(Font(font,size,weight=TEXT_WEIGHT["bold"]))
         else:
-            self.setFont(QFont(font,size,weight=TEXT_WEIGHT["normal"]))
+            self.setFont(Font(font,size,weight=TEXT_WEIGHT["normal"]))
 
 class PushButton(QPushButton):
     """
@@ -272,7 +305,7 @@ class PushButton(QPushButton):
         super().__init__(parent)
 
         self.setText(label)
-        self.setFont(QFont(font,size))
+        self.setFont(Font(font,size))
         self.setStyleSheet(styles.get("mainbutton"))
         self.setFocusPolicy(Qt.ClickFocus)
         self.setDefault(default)
@@ -282,9 +315,7 @@ class HIcon(QLabel):
     def __init__(self,iconpath:str="photo.svg",size:int=30,parent=None) -> QLabel:
         super().__init__(parent)
 
-        iconpixmap = QPixmap(iconpath)
-        iconpixmap = iconpixmap.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        self.setPixmap(iconpixmap)
+        self.setPixmap(Icons.pixmap(iconpath,size))
         self.setFixedWidth(size)
 
 class HSeparator(QFrame):